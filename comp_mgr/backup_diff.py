@@ -0,0 +1,95 @@
+"""
+Backup diff
+
+Compares two backups of the backup store by section and row. Sections and blocks whose hashes
+are equal are skipped without reading them, so only the blocks that actually changed are
+decoded. Rows are compared field by field, e.g. only the third value of a DTRB row.
+"""
+import json
+import logging
+from comp_mgr.block_store import BlockStore
+
+logger = logging.getLogger(__name__)
+
+def split_line(line: str) -> tuple[str, list[str]]:
+    """'DTRB.STDA[5]=DTRB[5],1,2' -> ('DTRB.STDA[5]', ['DTRB[5]', '1', '2'])"""
+    key, _, value = line.partition("=")
+    return key, value.split(",")
+
+def diff_fields(old: list[str], new: list[str]) -> list[dict]:
+    fields = []
+    for i in range(max(len(old), len(new))):
+        old_value = old[i] if i < len(old) else None
+        new_value = new[i] if i < len(new) else None
+        if old_value != new_value:
+            fields.append({"field": i, "old": old_value, "new": new_value})
+    return fields
+
+def diff_lines(section: str, old_lines: list[str], new_lines: list[str]) -> list[dict]:
+    """Changed, added and removed rows of one section, aligned by row key"""
+    old_rows = dict(split_line(line) for line in old_lines)
+    rows = []
+    for line in new_lines:
+        key, fields = split_line(line)
+        old_fields = old_rows.pop(key, None)
+        if old_fields is None:
+            rows.append({"section": section, "row": key, "status": "added", "new": ",".join(fields)})
+        elif old_fields != fields:
+            rows.append({"section": section, "row": key, "status": "changed",
+                         "fields": diff_fields(old_fields, fields)})
+    for key, fields in old_rows.items():
+        rows.append({"section": section, "row": key, "status": "removed", "old": ",".join(fields)})
+    return rows
+
+def diff_sections(store: BlockStore, old: dict, new: dict) -> list[dict]:
+    name = new["name"]
+    if old["rows"] != new["rows"]:
+        # Different layout (e.g. XAX1 with and without linear track): align the rows by key
+        return diff_lines(name, store.section_lines(old), store.section_lines(new))
+    rows = []
+    for old_block, new_block in zip(old["blocks"], new["blocks"]):
+        if old_block != new_block:
+            rows += diff_lines(name, store.get_block(old_block).decode('utf-8').splitlines(),
+                               store.get_block(new_block).decode('utf-8').splitlines())
+    return rows
+
+def diff(store: BlockStore, old: str, new: str) -> dict:
+    """
+    Structural diff of two backups in the store:
+    {"old": name, "new": name, "sections": n, "changed_sections": [...],
+     "rows": [{"section", "row", "status": "changed", "fields": [{"field", "old", "new"}]}, ...]}
+    Rows that only exist in one of the backups have the status "added" or "removed".
+    """
+    old_sections = {section["name"]: section for section in store.manifest(old)["sections"]}
+    new_sections = store.manifest(new)["sections"]
+    rows = []
+    for section in new_sections:
+        old_section = old_sections.pop(section["name"], None)
+        if old_section is None:
+            rows += diff_lines(section["name"], [], store.section_lines(section))
+        elif old_section["blocks"] != section["blocks"]:
+            rows += diff_sections(store, old_section, section)
+    for name, section in old_sections.items():
+        rows += diff_lines(name, store.section_lines(section), [])
+
+    return {"old": old, "new": new, "sections": len(new_sections),
+            "changed_sections": list(dict.fromkeys(row["section"] for row in rows)), "rows": rows}
+
+def format_diff(result: dict) -> list[str]:
+    """Lines of a diff for the TUI"""
+    lines = [f"{result['old']} -> {result['new']}",
+             f"{len(result['rows'])} rows in {len(result['changed_sections'])} of {result['sections']} sections differ", ""]
+    for row in result["rows"]:
+        if row["status"] == "changed":
+            for field in row["fields"]:
+                lines.append(f"{row['row']} [{field['field']}]: {field['old']} -> {field['new']}")
+        elif row["status"] == "added":
+            lines.append(f"+ {row['row']}={row['new']}")
+        else:
+            lines.append(f"- {row['row']}={row['old']}")
+    return lines
+
+def save_diff(result: dict, path) -> None:
+    with open(path, "w") as file:
+        json.dump(result, file, indent=2)
+    logger.info(f"Saved diff of {result['old']} and {result['new']} to {path}")
@@ -0,0 +1,215 @@
+"""
+Backup format
+
+Structured container written next to every .dat backup (same name, .rbk extension).
+It holds the same lines as the .dat file, plus an index of all sections and rows,
+such that single sections or rows can be read without parsing the whole file.
+read_data streams it along with the block store (see block_store) and the .dat, and
+BlockStore.export writes it for exported .dat files.
+
+Layout:
+    header  MAGIC, u32 length, JSON (identifier, serial number, firmware, ...)
+    data    the backup lines, '\n'-terminated, section after section
+    index   JSON: {"sections": [{"name", "offset", "length", "crc32", "rows": [[key, offset, length], ...]}]}
+    footer  u64 index offset, u32 index length, u32 index CRC32, u32 CRC32 of everything before the index, END_MAGIC
+
+A file without a valid footer was not written completely, e.g. because the program crashed.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from comp_mgr.exceptions import CorruptBackup
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RBK1"
+END_MAGIC = b"RBKE"
+EXTENSION = ".rbk"
+FOOTER = struct.Struct("<QIII4s")
+
+def section_name(keys: list[str]) -> str:
+    """Name of a section of rows, e.g. ['DTRB.STDA[0]', 'DTRB.STDA[1]', ...] -> 'DTRB.STDA'"""
+    if len(keys) == 1:
+        return keys[0]
+    return keys[0][:keys[0].rfind("[")]
+
+class BackupWriter:
+    """
+    Streams a backup into the container while it is read from the component:
+        with BackupWriter(path, header) as writer:
+            writer.begin_section(name)
+            writer.add_row("DTRB.STDA[0]", "DTRB.STDA[0]=...")
+    Only the index is kept in memory. The footer is only written if no exception occurred.
+    finish() may be called before leaving the with block, e.g. in a worker thread, because
+    it waits for the disk.
+    """
+
+    def __init__(self, path, header: dict):
+        self.path = path
+        self.header = header
+        self.file = None
+        self.sections = []
+        self.section = None
+        self.offset = 0
+        self.crc = 0
+        self.finished = False
+
+    def __enter__(self):
+        self.file = open(self.path, "xb")
+        header = json.dumps(self.header).encode('utf-8')
+        self._write(MAGIC + struct.pack("<I", len(header)) + header)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                if not self.finished:
+                    self.finish()
+            else:
+                logger.error(f"Backup container {self.path} is incomplete: {exc}")
+        finally:
+            self.file.close()
+        return False
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self.offset += len(data)
+
+    def begin_section(self, name: str) -> None:
+        self.section = {"name": name, "offset": self.offset, "length": 0, "crc32": 0, "rows": []}
+        self.sections.append(self.section)
+
+    def add_row(self, key: str, line: str) -> None:
+        data = f"{line}\n".encode('utf-8')
+        section = self.section
+        section["rows"].append([key, self.offset - section["offset"], len(data) - 1])
+        section["length"] += len(data)
+        section["crc32"] = zlib.crc32(data, section["crc32"])
+        self._write(data)
+
+    def finish(self) -> None:
+        """Write index and footer"""
+        index = json.dumps({"sections": self.sections}, separators=(",", ":")).encode('utf-8')
+        data_crc = self.crc
+        index_offset = self.offset
+        self.file.write(index)
+        self.file.write(FOOTER.pack(index_offset, len(index), zlib.crc32(index), data_crc, END_MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.finished = True
+
+class BackupReader:
+    """
+    Random access to a backup container through mmap:
+        with BackupReader(path) as backup:
+            backup.value("DTRB.STDA[37]")
+    Sections are checked against their checksum when they are read, verify() checks the whole file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if size < len(MAGIC) + 4 + FOOTER.size:
+                raise CorruptBackup(f"{path} is truncated")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_index(size)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def _read_index(self, size: int) -> None:
+        index_offset, index_length, index_crc, self.data_crc, end_magic = FOOTER.unpack(self.map[size - FOOTER.size:])
+        if self.map[:len(MAGIC)] != MAGIC or end_magic != END_MAGIC:
+            raise CorruptBackup(f"{self.path} has no valid footer, it was not written completely")
+        if index_offset + index_length != size - FOOTER.size:
+            raise CorruptBackup(f"{self.path} has an invalid index position")
+        index = self.map[index_offset:index_offset + index_length]
+        if zlib.crc32(index) != index_crc:
+            raise CorruptBackup(f"{self.path} has a corrupt index")
+        self.data_end = index_offset
+
+        (header_length,) = struct.unpack_from("<I", self.map, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self.map[header_start:header_start + header_length])
+        self.sections = json.loads(index)["sections"]
+        self.verified = set()
+        # Row key -> (section number, row number)
+        self.rows = {}
+        for n, section in enumerate(self.sections):
+            for m, (key, _, _) in enumerate(section["rows"]):
+                self.rows.setdefault(key, (n, m))
+
+    def verify(self) -> None:
+        """Check the checksum of the whole file"""
+        with memoryview(self.map) as view:
+            crc = zlib.crc32(view[:self.data_end])
+        if crc != self.data_crc:
+            raise CorruptBackup(f"{self.path} does not match its checksum")
+
+    def _check_section(self, n: int) -> dict:
+        section = self.sections[n]
+        if n not in self.verified:
+            with memoryview(self.map) as view:
+                crc = zlib.crc32(view[section["offset"]:section["offset"] + section["length"]])
+            if crc != section["crc32"]:
+                raise CorruptBackup(f"Section {section['name']} of {self.path} does not match its checksum")
+            self.verified.add(n)
+        return section
+
+    def _line(self, section: dict, row: list) -> str:
+        start = section["offset"] + row[1]
+        return self.map[start:start + row[2]].decode('utf-8')
+
+    def section_names(self) -> list[str]:
+        return [section["name"] for section in self.sections]
+
+    def section(self, name: str) -> list[str]:
+        """All lines of one section, e.g. 'DTRB.STDA'"""
+        for n, section in enumerate(self.sections):
+            if section["name"] == name:
+                self._check_section(n)
+                return [self._line(section, row) for row in section["rows"]]
+        raise KeyError(name)
+
+    def block(self, block: str) -> list[str]:
+        """All lines of all sections of one block, e.g. 'XAX1' (STDT, SPRM and SEPM)"""
+        lines = []
+        for n, section in enumerate(self.sections):
+            if section["name"].split(".")[0] == block:
+                self._check_section(n)
+                lines += [self._line(section, row) for row in section["rows"]]
+        return lines
+
+    def line(self, key: str) -> str:
+        """The backup line of one row, e.g. 'DTRB.STDA[37]'"""
+        n, m = self.rows[key]
+        section = self._check_section(n)
+        return self._line(section, section["rows"][m])
+
+    def value(self, key: str) -> str:
+        return self.line(key).split("=", 1)[1]
+
+    def lines(self):
+        for n, section in enumerate(self.sections):
+            self._check_section(n)
+            for row in section["rows"]:
+                yield self._line(section, row)
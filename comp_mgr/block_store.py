@@ -0,0 +1,294 @@
+"""
+Block store
+
+Content-addressed storage of backups. Every block of a backup (up to CHUNK_ROWS lines of one
+section) is stored once under its SHA-256, and a backup is a small manifest listing the hashes.
+Backups of the same component share almost all of their blocks, e.g. _ORG and the backup
+after an autosetup differ in a handful of rows only.
+
+Layout below the store root:
+    objects/ab/ab12...    zlib-compressed block, named after the SHA-256 of its lines
+    manifests/NAME.json   {"header": {...}, "sections": [{"name", "rows", "blocks": [hash, ...]}]}
+    catalog.sqlite3       index of all manifests, see catalog
+
+Blocks are only ever added, and a manifest is written last, such that a backup interrupted
+by a crash leaves no manifest behind. The new blocks of a backup are staged under temporary
+names first, and only synced to disk and renamed to their hash when the backup is committed,
+with a single pass of fsyncs instead of one per block.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from pathlib import Path
+from comp_mgr import backup_format
+from comp_mgr.catalog import BackupCatalog
+from comp_mgr.exceptions import CorruptBackup
+
+logger = logging.getLogger(__name__)
+
+# Rows per block. A changed row only costs one block of a large table
+CHUNK_ROWS = 64
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Workers may store the same block at the same time, each one writes its own temporary file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def _fsync(path: Path) -> None:
+    # Windows can only sync files opened for writing
+    with open(path, "rb+") as file:
+        os.fsync(file.fileno())
+
+def _fsync_directory(path: Path) -> None:
+    # Renames are durable once their directory is synced, NTFS journals them itself
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class BlockStore:
+    """
+    Backups by name, e.g. 'eTRB0_1234_20260101_1_ORG':
+        with store.writer(name, header) as writer:
+            writer.begin_section("DTRB.STDA")
+            writer.add_row("DTRB.STDA[0]", "DTRB.STDA[0]=...")
+        store.lines(name)
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.manifests = self.root / "manifests"
+        self.catalog = BackupCatalog(self.root / "catalog.sqlite3")
+        if self.catalog.created and self.manifests.is_dir():
+            self.rebuild_catalog()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def _manifest_path(self, name: str) -> Path:
+        return self.manifests / f"{name}.json"
+
+    # ========== Blocks ==========
+
+    def has_block(self, digest: str) -> bool:
+        return self._object_path(digest).exists()
+
+    def stage_block(self, data: bytes, tag: str) -> tuple[str, Path | None]:
+        """
+        Write a block that is not stored yet under a temporary name (unique per tag), without
+        waiting for the disk. Returns (hash, temporary path), the path is None if the block is
+        stored already. See commit_blocks.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if path.exists():
+            return digest, None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{tag}.tmp")
+        with open(tmp_path, "wb") as file:
+            file.write(zlib.compress(data))
+        return digest, tmp_path
+
+    def commit_blocks(self, staged: dict[str, Path]) -> None:
+        """Sync staged blocks (hash -> temporary path) to disk and rename them to their hash"""
+        for tmp_path in staged.values():
+            _fsync(tmp_path)
+        for digest, tmp_path in staged.items():
+            os.replace(tmp_path, self._object_path(digest))
+        for directory in {tmp_path.parent for tmp_path in staged.values()}:
+            _fsync_directory(directory)
+
+    def discard_blocks(self, staged: dict[str, Path]) -> None:
+        for tmp_path in staged.values():
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get_block(self, digest: str) -> bytes:
+        try:
+            with open(self._object_path(digest), "rb") as file:
+                data = zlib.decompress(file.read())
+        except FileNotFoundError:
+            raise CorruptBackup(f"Block {digest} is missing from {self.root}")
+        except zlib.error as e:
+            raise CorruptBackup(f"Block {digest} in {self.root} is corrupt: {e}")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise CorruptBackup(f"Block {digest} in {self.root} does not match its hash")
+        return data
+
+    # ========== Manifests ==========
+
+    def writer(self, name: str, header: dict) -> "StoreWriter":
+        return StoreWriter(self, name, header)
+
+    def has_backup(self, name: str) -> bool:
+        return self._manifest_path(name).exists()
+
+    def put_manifest(self, name: str, manifest: dict) -> None:
+        path = self._manifest_path(name)
+        if path.exists():
+            raise FileExistsError(f"Backup {name} exists already")
+        self.manifests.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(manifest, indent=1).encode('utf-8')
+        _write_atomic(path, data)
+        self.catalog.record(name, manifest["header"], path, hashlib.sha256(data).hexdigest())
+
+    def manifest(self, name: str) -> dict:
+        try:
+            with open(self._manifest_path(name), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise KeyError(name)
+        except ValueError as e:
+            raise CorruptBackup(f"Manifest of backup {name} is corrupt: {e}")
+
+    def header(self, name: str) -> dict:
+        return self.manifest(name)["header"]
+
+    def names(self, identifier: str = "", limit: int | None = None) -> list[str]:
+        """Names of the backups of an identifier (or the start of it), newest first"""
+        return self.catalog.names(identifier, limit)
+
+    def rebuild_catalog(self) -> None:
+        """Record all manifests in the catalog, e.g. after the catalog was deleted"""
+        for path in self.manifests.glob("*.json"):
+            with open(path, "rb") as file:
+                data = file.read()
+            try:
+                header = json.loads(data)["header"]
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skipping corrupt manifest {path}: {e}")
+                continue
+            self.catalog.record(path.stem, header, path, hashlib.sha256(data).hexdigest())
+        logger.info(f"Rebuilt backup catalog of {self.root}")
+
+    # ========== Reading backups ==========
+
+    def section_lines(self, section: dict) -> list[str]:
+        lines = []
+        for digest in section["blocks"]:
+            lines += self.get_block(digest).decode('utf-8').splitlines()
+        return lines
+
+    def lines(self, name: str) -> list[str]:
+        """All lines of a backup, as in the .dat file"""
+        lines = []
+        for section in self.manifest(name)["sections"]:
+            lines += self.section_lines(section)
+        return lines
+
+    def section(self, name: str, section_name: str) -> list[str]:
+        """All lines of one section of a backup, e.g. 'DTRB.STDA'"""
+        for section in self.manifest(name)["sections"]:
+            if section["name"] == section_name:
+                return self.section_lines(section)
+        raise KeyError(section_name)
+
+    def block(self, name: str, block: str) -> list[str]:
+        """All lines of all sections of one block, e.g. 'XAX1' (STDT, SPRM and SEPM)"""
+        lines = []
+        for section in self.manifest(name)["sections"]:
+            if section["name"].split(".")[0] == block:
+                lines += self.section_lines(section)
+        return lines
+
+    def export(self, name: str, directory) -> Path:
+        """Write a backup as .dat file, and as indexed container next to it (see backup_format)"""
+        manifest = self.manifest(name)
+        # Earlier exports and legacy .dat files of the same name are kept, the export gets a number
+        filename = Path(directory) / f"{name}.dat"
+        number = 0
+        while filename.exists() or filename.with_suffix(backup_format.EXTENSION).exists():
+            number += 1
+            filename = Path(directory) / f"{name}_{number}.dat"
+        with open(filename, "x") as backup, \
+             backup_format.BackupWriter(filename.with_suffix(backup_format.EXTENSION), manifest["header"]) as container:
+            for section in manifest["sections"]:
+                container.begin_section(section["name"])
+                for line in self.section_lines(section):
+                    print(line, file=backup)
+                    container.add_row(line.split("=", 1)[0], line)
+        logger.info(f"Exported backup {name} to {filename}")
+        return filename
+
+class StoreWriter:
+    """
+    Streams a backup into the store while it is read from the component, with the same
+    interface as backup_format.BackupWriter. At most one block is kept in memory.
+    The backup is only committed (new blocks synced, manifest written) if no exception occurred.
+    finish() may be called before leaving the with block, e.g. in a worker thread, because
+    it waits for the disk.
+    """
+
+    def __init__(self, store: BlockStore, name: str, header: dict):
+        self.store = store
+        self.name = name
+        self.header = header
+        self.sections = []
+        self.section = None
+        self.chunk = []
+        # New blocks of this backup: hash -> temporary path
+        self.staged = {}
+        self.finished = False
+        self.blocks_stored = 0
+        self.blocks_total = 0
+        self.bytes_stored = 0
+
+    def __enter__(self):
+        if self.store.has_backup(self.name):
+            raise FileExistsError(f"Backup {self.name} exists already")
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            if not self.finished:
+                self.finish()
+        else:
+            self.store.discard_blocks(self.staged)
+            logger.error(f"Backup {self.name} is incomplete and was not stored: {exc}")
+        return False
+
+    def _flush_chunk(self) -> None:
+        if not self.chunk:
+            return
+        data = "".join(self.chunk).encode('utf-8')
+        # Other writers (e.g. of a parallel autosetup) use other temporary names
+        digest, tmp_path = self.store.stage_block(data, f"{os.getpid()}.{id(self)}")
+        self.section["blocks"].append(digest)
+        self.blocks_total += 1
+        if tmp_path is not None and digest not in self.staged:
+            self.staged[digest] = tmp_path
+            self.blocks_stored += 1
+            self.bytes_stored += len(data)
+        self.chunk = []
+
+    def begin_section(self, name: str) -> None:
+        self._flush_chunk()
+        self.section = {"name": name, "rows": 0, "blocks": []}
+        self.sections.append(self.section)
+
+    def add_row(self, key: str, line: str) -> None:
+        self.chunk.append(f"{line}\n")
+        self.section["rows"] += 1
+        if len(self.chunk) >= CHUNK_ROWS:
+            self._flush_chunk()
+
+    def finish(self) -> None:
+        self._flush_chunk()
+        self.store.commit_blocks(self.staged)
+        self.store.put_manifest(self.name, {"header": self.header, "sections": self.sections})
+        self.finished = True
+        logger.info(f"Stored backup {self.name}: {self.blocks_stored} of {self.blocks_total} blocks new "
+                    f"({self.bytes_stored} bytes)")
@@ -0,0 +1,85 @@
+"""
+Component cache
+
+Remembers the last discovery and the identity of every component on disk, such that the main
+menu can be drawn right away at the next start and revalidated in the background.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+def app_dir() -> Path:
+    """Next to the executable like Rorze.get_backup_dir, Pyinstaller doesn't keep the cwd"""
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).parent
+    else:
+        return Path(__file__).resolve().parent.parent
+
+class ComponentCache:
+    """
+    JSON file with the discovered IPs and one comp_info per IP:
+    {"discovered": ["192.168.0.1", ...],
+     "components": {"192.168.0.1": {"IP": ..., "Name": ..., "SN": ..., "Banner": "eTRB1"}}}
+
+    A cached identity is only reused if the component still sends the same CNCT banner and
+    serial number, see Rorze.identify.
+    """
+    PATH = str(app_dir() / "cache" / "components.json")
+
+    def __init__(self, path: str = PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"discovered": [], "components": {}}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+            self.data["discovered"] = list(data.get("discovered", []))
+            self.data["components"] = dict(data.get("components", {}))
+        except FileNotFoundError:
+            logger.debug(f"ComponentCache.load() -> No cache at {self.path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable component cache {self.path}: {e}")
+
+    def save(self) -> None:
+        """Write the cache atomically, such that a crash never leaves half a file"""
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as file:
+                    json.dump(self.data, file, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Unable to write component cache {self.path}: {e}")
+
+    def discovered(self) -> list[str]:
+        with self.lock:
+            return list(self.data["discovered"])
+
+    def set_discovered(self, ips: list[str]) -> None:
+        with self.lock:
+            self.data["discovered"] = list(ips)
+        self.save()
+
+    def get(self, ip: str) -> dict | None:
+        """Cached comp_info of ip, including the CNCT banner it was identified with"""
+        with self.lock:
+            entry = self.data["components"].get(ip)
+            return dict(entry) if entry else None
+
+    def put(self, comp_info: dict, banner: str) -> None:
+        entry = dict(comp_info)
+        entry["Banner"] = banner
+        with self.lock:
+            self.data["components"][comp_info["IP"]] = entry
+        self.save()
+
+COMPONENT_CACHE = ComponentCache()
@@ -0,0 +1,274 @@
+"""
+Capture module
+
+Opt-in recorder of the traffic with Rorze components, and a replay server for the captures.
+While recording is enabled (environment variable COMP_MGR_CAPTURE=<directory>, or
+RECORDER.enable(directory)), every connection writes each frame sent and received with its
+monotonic time to a capture file. The replay server plays a capture back on a local TCP port
+with the original or scaled timing, such that a session of a real component can be reproduced
+and benchmarked without the hardware.
+
+Capture file:
+    b"RCAP", version (uint8), length of the metadata (uint16), metadata (JSON)
+    per frame: direction (b">" sent to the component, b"<" received), nanoseconds since the
+    start of the capture (uint64), length (uint32), the frame without its '\r'
+
+Usage:
+    python -m comp_mgr.capture dump logs/captures/192.168.30.20_20260101_120000_1.rcap
+    python -m comp_mgr.capture replay logs/captures/192.168.30.20_20260101_120000_1.rcap --scale 0.5
+"""
+import argparse
+import atexit
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RCAP"
+VERSION = 1
+HEADER = struct.Struct("<BH")
+RECORD = struct.Struct("<cQI")
+SENT = b">"
+RECEIVED = b"<"
+
+class CaptureWriter:
+    """Capture of one connection. sent() and received() are called by the transport"""
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.file = open(path, "wb")
+        self.start = time.monotonic_ns()
+        meta = json.dumps({**meta, "start": time.time()}).encode('utf-8')
+        self.file.write(MAGIC + HEADER.pack(VERSION, len(meta)) + meta)
+
+    def record(self, direction: bytes, frame) -> None:
+        record = RECORD.pack(direction, time.monotonic_ns() - self.start, len(frame))
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(record)
+            self.file.write(frame)
+            self.frames += 1
+
+    def sent(self, data: bytes) -> None:
+        """Data as sent on the socket, i.e. one or more '\r'-terminated commands"""
+        for frame in data.split(b"\r")[:-1]:
+            self.record(SENT, frame)
+
+    def received(self, frame) -> None:
+        """One frame without its '\r'"""
+        self.record(RECEIVED, frame)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.close()
+        logger.info(f"Capture of {self.frames} frames saved to {self.path}")
+
+class Recorder:
+    """Opens a capture for every new connection, while a capture directory is set"""
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self.captures = weakref.WeakSet()
+        self.counter = itertools.count(1)
+
+    def enable(self, directory: str) -> None:
+        self.directory = directory
+
+    def disable(self) -> None:
+        self.directory = None
+
+    def open(self, ip: str, port: int) -> CaptureWriter | None:
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, f"{ip}_{datetime.now():%Y%m%d_%H%M%S}_{next(self.counter)}.rcap")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            capture = CaptureWriter(path, {"ip": ip, "port": port})
+        except OSError as e:
+            logger.warning(f"Unable to record {ip}: {e}")
+            return None
+        logger.debug(f"Recording {ip}:{port} to {path}")
+        self.captures.add(capture)
+        return capture
+
+    def close_all(self) -> None:
+        for capture in list(self.captures):
+            capture.close()
+
+RECORDER = Recorder(os.environ.get("COMP_MGR_CAPTURE"))
+atexit.register(RECORDER.close_all)
+
+def read_capture(path: str) -> tuple[dict, list[tuple[bytes, float, bytes]]]:
+    """Metadata and frames of a capture, each frame a tuple of direction, seconds and frame"""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a capture")
+    version, meta_length = HEADER.unpack_from(data, len(MAGIC))
+    if version != VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+    offset = len(MAGIC) + HEADER.size
+    meta = json.loads(data[offset:offset + meta_length])
+    offset += meta_length
+
+    frames = []
+    while offset + RECORD.size <= len(data):
+        direction, ns, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            # Truncated by a crash while recording
+            logger.warning(f"{path}: last frame is incomplete")
+            break
+        frames.append((direction, ns / 1e9, data[offset:offset + length]))
+        offset += length
+    return meta, frames
+
+def answers(reply: bytes, command: bytes) -> bool:
+    """Whether a reply such as b'aTRB0.DEQU.GTDT:5' answers a command such as b'oTRB0.DEQU.GTDT[1]'"""
+    return command[1:].startswith(reply[1:].split(b":", 1)[0])
+
+def schedule(frames: list[tuple[bytes, float, bytes]]) -> tuple[list[bytes], list[tuple[int, float, bytes]]]:
+    """
+    The commands of a capture, and the received frames as (command index, delay, frame): each
+    reply belongs to the oldest command it answers, events belong to the command answered
+    before them (-1 before the first command).
+    The component works through its commands one after the other, so the delay is the time it
+    spent on the frame: from the later of its command and the previous frame.
+    """
+    commands, sent, replies = [], [], []
+    answered = 0  # Commands before this index are answered (or were never answered)
+    last = -1
+    previous = 0.0
+    for direction, seconds, frame in frames:
+        if direction == SENT:
+            commands.append(frame)
+            sent.append(seconds)
+            continue
+        for i in range(answered, len(commands)):
+            if answers(frame, commands[i]):
+                last, answered = i, i + 1
+                break
+        start = max(sent[last] if last >= 0 else 0.0, previous)
+        replies.append((last, max(seconds - start, 0.0), frame))
+        previous = seconds
+    return commands, replies
+
+class ReplayServer:
+    """
+    Serves a capture on a local TCP port, acting as the recorded component. Each recorded reply
+    is sent once its command has arrived and the previous reply is out, after the recorded time
+    the component spent on it multiplied by scale (0.5 replays twice as fast, 0 without any
+    delay). Replies are matched to commands instead of replaying the recorded order, because
+    the client may pipeline the commands differently than during the recording. Commands that
+    differ from the recording are counted as mismatches.
+    """
+
+    def __init__(self, path: str, host: str = "127.0.0.1", port: int = 12100, scale: float = 1.0):
+        self.path = path
+        self.meta, frames = read_capture(path)
+        self.commands, self.replies = schedule(frames)
+        self.scale = scale
+        self.sock = socket.create_server((host, port))
+        self.address = self.sock.getsockname()
+        self.mismatches = 0
+
+    def serve(self, sessions: int | None = 1) -> None:
+        """Replay the capture to each client in turn, forever if sessions is None"""
+        logger.info(f"Replaying {self.path} ({len(self.commands)} commands, {len(self.replies)} replies) "
+                    f"on {self.address[0]}:{self.address[1]}")
+        served = 0
+        with self.sock:
+            while sessions is None or served < sessions:
+                conn, address = self.sock.accept()
+                logger.info(f"Replay client {address[0]}:{address[1]} connected")
+                with conn:
+                    self.replay(conn)
+                served += 1
+
+    def replay(self, conn: socket.socket) -> None:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        commands = read_frames(conn)
+        start = time.monotonic()
+        arrivals = []  # Arrival time of every command of the client
+
+        def read_command() -> None:
+            command = next(commands)
+            i = len(arrivals)
+            arrivals.append(time.monotonic())
+            expected = self.commands[i] if i < len(self.commands) else b"(end of capture)"
+            if command != expected:
+                self.mismatches += 1
+                logger.warning(f"Replay mismatch: expected {expected.decode('utf-8', 'replace')}, "
+                               f"got {command.decode('utf-8', 'replace')}")
+
+        replayed = 0
+        due = start  # Time the last reply was due
+        try:
+            for i, delay, frame in self.replies:
+                while len(arrivals) <= i:
+                    read_command()
+                due = max(arrivals[i] if i >= 0 else start, due) + delay * self.scale
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                conn.sendall(frame + b"\r")
+                replayed += 1
+            # The capture is over, commands the client still sends are left unanswered
+            while True:
+                read_command()
+        except OSError as e:
+            logger.info(f"Replay client disconnected: {e}")
+        logger.info(f"Replayed {replayed}/{len(self.replies)} replies to {len(arrivals)} commands in "
+                    f"{time.monotonic() - start:.2f}s, {self.mismatches} mismatches")
+
+def read_frames(conn: socket.socket) -> Iterator[bytes]:
+    """The '\r'-terminated frames a client sends, without the '\r'"""
+    buffer = b""
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            raise ConnectionError("Client closed the connection")
+        *frames, buffer = (buffer + data).split(b"\r")
+        yield from frames
+
+def dump(path: str) -> None:
+    meta, frames = read_capture(path)
+    print(json.dumps(meta))
+    for direction, seconds, frame in frames:
+        print(f"{seconds:12.6f} {direction.decode()} {frame.decode('utf-8', 'replace')}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m comp_mgr.capture", description="Inspect and replay captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump_parser = commands.add_parser("dump", help="Print the frames of a capture")
+    dump_parser.add_argument("path")
+    replay_parser = commands.add_parser("replay", help="Serve a capture on a local TCP port")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=12100)
+    replay_parser.add_argument("--scale", type=float, default=1.0, help="Factor on the recorded delays, 0 for none")
+    replay_parser.add_argument("--sessions", type=int, default=1, help="Clients to serve, 0 for unlimited")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.command == "dump":
+        dump(args.path)
+    else:
+        ReplayServer(args.path, args.host, args.port, args.scale).serve(args.sessions or None)
+
+if __name__ == "__main__":
+    main()
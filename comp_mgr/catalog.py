@@ -0,0 +1,103 @@
+"""
+Backup catalog
+
+SQLite index of all backups in a backup store, written together with every manifest. Lookups
+such as the latest backup of a serial number, or the next free backup index, are indexed
+queries instead of scans over the backup directory.
+"""
+import logging
+import re
+import sqlite3
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Backup names look like 'RR754_SN123_20260101_2_ORG', day and index are taken from them
+NAME_PATTERN = re.compile(r"_(\d{8})_(\d+)(?:_[^\d].*)?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    name TEXT PRIMARY KEY,
+    sn TEXT,
+    identifier TEXT,
+    firmware TEXT,
+    time TEXT,
+    day TEXT,
+    idx INTEGER,
+    suffix TEXT,
+    path TEXT,
+    checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS backups_sn ON backups (sn, time);
+CREATE INDEX IF NOT EXISTS backups_identifier ON backups (identifier, time);
+CREATE INDEX IF NOT EXISTS backups_day ON backups (sn, day, suffix, idx);
+"""
+
+class BackupCatalog:
+    """
+    One row per backup:
+    name, sn, identifier, firmware, time (ISO), day (YYYYMMDD), idx, suffix, path, checksum.
+    Every call opens its own connection, such that autosetup threads can record in parallel.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.created = not path.exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self.connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def record(self, name: str, header: dict, path, checksum: str) -> None:
+        match = NAME_PATTERN.search(name)
+        day, index = (match.group(1), int(match.group(2))) if match else (None, None)
+        with closing(self.connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (name, header.get("SN"), header.get("Identifier"), header.get("Firmware"),
+                        header.get("Time"), day, index, header.get("Suffix", ""), str(path), checksum))
+        logger.debug(f"BackupCatalog.record() -> {name} {checksum}")
+
+    def remove(self, name: str) -> None:
+        with closing(self.connect()) as db, db:
+            db.execute("DELETE FROM backups WHERE name = ?", (name,))
+
+    def get(self, name: str) -> dict | None:
+        with closing(self.connect()) as db:
+            row = db.execute("SELECT * FROM backups WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def exists(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def latest(self, sn: str, suffix: str | None = None) -> dict | None:
+        """Latest backup of a serial number, optionally only with the given suffix (e.g. '_ORG')"""
+        query = "SELECT * FROM backups WHERE sn = ?"
+        args = [sn]
+        if suffix is not None:
+            query += " AND suffix = ?"
+            args.append(suffix)
+        with closing(self.connect()) as db:
+            row = db.execute(f"{query} ORDER BY time DESC, idx DESC LIMIT 1", args).fetchone()
+        return dict(row) if row else None
+
+    def next_index(self, sn: str, day: str, suffix: str = "") -> int:
+        """Backup index of the day that is higher than all indexes used so far for the suffix"""
+        with closing(self.connect()) as db:
+            (index,) = db.execute("SELECT MAX(idx) FROM backups WHERE sn = ? AND day = ? AND suffix = ?",
+                                  (sn, day, suffix)).fetchone()
+        return (index or 0) + 1
+
+    def names(self, identifier: str = "", limit: int | None = None) -> list[str]:
+        """Names of the backups of components whose identifier starts with identifier, newest first"""
+        query = "SELECT name FROM backups WHERE identifier GLOB ? ORDER BY time DESC, idx DESC"
+        args = [f"{identifier}*"]
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(limit)
+        with closing(self.connect()) as db:
+            return [row["name"] for row in db.execute(query, args)]
@@ -3,94 +3,170 @@ CLI interface for Component Manager project.
 """
 import curses
 import logging
-import os
 import sys
 import threading
 import time
+from comp_mgr.cache import COMPONENT_CACHE
 from comp_mgr.comp_if import CompIF
 from comp_mgr.comp import *
 from comp_mgr.exceptions import *
+from comp_mgr.log import setup_logging
 from comp_mgr.ui import TestingMenu, ComponentMenu, AutosetupMenu
-from comp_mgr.ui.common_ui import draw_status_popup
-
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    filename="logs/component_manager.log",
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+from comp_mgr.ui.common_ui import draw_status_popup, redraw_timeout, PopupInput, Screen, WAKEUP
+
+setup_logging()
 logging.raiseExceptions = True
 
 class Menu:
 
-    def __init__(self, ip_list: list):
+    def __init__(self, ip_list: list, rediscover: bool = False):
         ####################### Start in simulation mode #######################
         self.simulation = False
         ########################################################################
         self.ip_list = ip_list.copy()
-        self.buttons = {ip: "[...loading]" for ip in self.ip_list}
+        # Cached components are shown right away, until they are revalidated
+        self.buttons = {ip: self.cached_button_text(ip) for ip in self.ip_list}
+        # Discover in the background, ip_list is the last discovery from the cache
+        self.rediscover = rediscover
         self.status_message = None
         self.status_until = 0
+        self.all_components = {}
+        # IPs found by a subnet sweep or a rediscovery, handed from those threads to the menu
+        self.swept = set()
+        self.new_ips = []
+        self.sweep_status = None
         logger.info(40 * "=" + " PROGRAM START" + 40 * "=")
 
     def init_button_list(self):
         self.button_list = self.ip_list.copy()
         #self.button_list.append('Testing')
         self.button_list.append('Retry connection')
+        self.button_list.append('Sweep subnets')
         self.button_list.append('Autosetup Menu')
         self.button_list.append('Quit')
     
     def set_status(self, message, duration=3):
         self.status_message = message
         self.status_until = time.time() + duration
+        WAKEUP.notify()
 
     def update_main_buttons(self) -> None:
         """Get component information from each ip address and update the displayed text"""
-        comp_if = CompIF()
         self.all_components = {}
+        for ip in self.ip_list:
+            threading.Thread(target=self.update_button, args=(ip,),daemon=True).start()
 
-        def update_button(ip: str) -> None:
-            comp_info = comp_if.get_component_info(ip)
-            self.all_components[ip] = comp_info
-            system = comp_info['System']
-            type = comp_info['Type']
-            name = comp_info['Name']
-            sn = comp_info['SN']
-            firmware = comp_info['Firmware']
-
-            # Information Cascade - Reduce infomation if not available
-            if firmware:
-                info = f"{system} {type} {name} {sn} v{firmware} \u2713"
-            elif name:
-                info = f"{system} {type} {name} {sn}"
-            elif system:
-                info = f"{system} {type}"
-            elif type:
-                info = type
-            else:
-                info = "[unidentified]"
-            self.buttons[ip] = info
+    def update_button(self, ip: str, connect_unknown: bool = False) -> None:
+        comp_info = CompIF().get_component_info(ip, connect_unknown)
+        self.all_components[ip] = comp_info
+        self.buttons[ip] = self.button_text(comp_info)
+        WAKEUP.notify()
 
+    def cached_button_text(self, ip: str) -> str:
+        comp_info = COMPONENT_CACHE.get(ip)
+        if comp_info is None:
+            return "[...loading]"
+        return f"{self.button_text(comp_info)} (stale)"
+
+    def button_text(self, comp_info: dict) -> str:
+        system = comp_info['System']
+        type = comp_info['Type']
+        name = comp_info['Name']
+        sn = comp_info['SN']
+        firmware = comp_info['Firmware']
+
+        # Information Cascade - Reduce infomation if not available
+        if firmware:
+            info = f"{system} {type} {name} {sn} v{firmware} \u2713"
+        elif name:
+            info = f"{system} {type} {name} {sn}"
+        elif system:
+            info = f"{system} {type}"
+        elif type:
+            info = type
+        else:
+            info = "[unidentified]"
+        return info
+
+    def discover_in_background(self) -> None:
+        """Discover and identify the components, every row is shown as soon as it is identified"""
+        found = set()
+        try:
+            for comp_info in CompIF().discover_components():
+                ip = comp_info["IP"]
+                found.add(ip)
+                if ip in self.ip_list:
+                    self.all_components[ip] = comp_info
+                    self.buttons[ip] = self.button_text(comp_info)
+                else:
+                    self.new_ips.append((ip, False, comp_info))
+                WAKEUP.notify()
+        except Exception as e:
+            # E.g. both SemDex and WMC components found, the rows found so far stay
+            logger.error(f"Discovery failed: {e}")
+            self.set_status(f"Discovery failed: {e}", 5)
+
+        # Cached components, which were not found this time
         for ip in self.ip_list:
-            threading.Thread(target=update_button, args=(ip,),daemon=True).start()
+            if ip not in found and ip not in self.swept:
+                threading.Thread(target=self.update_button, args=(ip,), daemon=True).start()
+
+    def sweep_subnets(self, cidrs: list[str]) -> None:
+        """Sweep the subnets and hand every new component over to the menu"""
+        comp_if = CompIF()
+        found = 0
+        self.sweep_status = f"Sweeping {', '.join(cidrs)}..."
+        try:
+            for ip in comp_if.sweep(cidrs):
+                found += 1
+                self.sweep_status = f"Sweeping {', '.join(cidrs)}... ({found} found)"
+                self.new_ips.append((ip, True, None))
+                WAKEUP.notify()
+        except ValueError as e:
+            logger.error(f"Invalid subnet: {e}")
+            self.set_status(f"Invalid subnet: {e}")
+            return
+        finally:
+            self.sweep_status = None
+            WAKEUP.notify()
+        logger.info(f"Sweep done, found {found} components")
+        self.set_status(f"Sweep done, found {found} components")
+
+    def add_new_ips(self) -> int:
+        """Add newly found components to the list. Returns the number of new rows"""
+        n_new = 0
+        while self.new_ips:
+            ip, swept, comp_info = self.new_ips.pop(0)
+            if ip in self.ip_list:
+                continue
+            n_new += 1
+            self.ip_list.append(ip)
+            if swept:
+                self.swept.add(ip)
+            if comp_info:
+                self.all_components[ip] = comp_info
+                self.buttons[ip] = self.button_text(comp_info)
+            else:
+                self.buttons[ip] = "[...loading]"
+                threading.Thread(target=self.update_button, args=(ip, swept), daemon=True).start()
+        if n_new:
+            self.init_button_list()
+        return n_new
 
-    def draw_main_menu(self, stdscr, current_row):
-        stdscr.clear()
+    def draw_main_menu(self, screen, current_row):
         for i, row in enumerate(self.button_list):
             display_text = row
             if row in self.buttons:
                 display_text += f" → {self.buttons[row]}"
-            if i == current_row:
-                stdscr.attron(curses.color_pair(1))
-                stdscr.addstr(i + 2, 2, display_text[:curses.COLS - 4])
-                stdscr.attroff(curses.color_pair(1))
-            else:
-                stdscr.addstr(i + 2, 2, display_text[:curses.COLS - 4])
+            attr = curses.color_pair(1) if i == current_row else 0
+            screen.put(i + 2, 2, display_text[:curses.COLS - 4], attr)
 
-        draw_status_popup(stdscr, self.status_message, self.status_until)
+        if self.sweep_status:
+            screen.put(len(self.button_list) + 3, 2, self.sweep_status[:curses.COLS - 4])
 
-        stdscr.refresh()
+        draw_status_popup(screen, self.status_message, self.status_until)
+
+        screen.render()
 
     def run_main_menu(self, stdscr):
         self.init_button_list()
@@ -99,36 +175,55 @@ class Menu:
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
         current_row = 0
-        stdscr.timeout(500)
+        screen = Screen(stdscr)
 
         # threading.Thread(target=self.update_main_buttons, daemon=True).start()
-        self.update_main_buttons()
+        if self.rediscover:
+            threading.Thread(target=self.discover_in_background, daemon=True).start()
+        else:
+            self.update_main_buttons()
 
         while True:
-            self.draw_main_menu(stdscr, current_row)
-            key = stdscr.getch()
+            # Keep the selected row, when new components are inserted above it
+            n_new = self.add_new_ips()
+            if current_row >= len(self.ip_list) - n_new:
+                current_row += n_new
+            self.draw_main_menu(screen, current_row)
+            # Workers wake the menu up, the only timer is the end of the status popup
+            key = WAKEUP.wait(stdscr, redraw_timeout(self.status_until))
             if key == curses.KEY_UP:
                 current_row = (current_row - 1) % len(self.button_list)
             elif key == curses.KEY_DOWN:
                 current_row = (current_row + 1) % len(self.button_list)
             elif key == ord('\n'):  # Enter key
+                # Popups and submenus draw over the menu
+                screen.invalidate()
                 selected = self.button_list[current_row]
                 if selected == 'Quit':
                     sys.exit(0)
                 elif selected == 'Testing':
                     TestingMenu().run(stdscr)
                 elif selected == 'Retry connection':
-                    stdscr.addstr(len(self.button_list) + 3, 2, "Scanning for components...")
-                    stdscr.refresh()
-                    comp_if = CompIF()
-                    self.ip_list = comp_if.discover()
-                    self.buttons = {ip: "[...loading]" for ip in self.ip_list}
+                    # Components show up again, as soon as they are identified
+                    self.ip_list = []
+                    self.buttons = {}
+                    self.all_components = {}
+                    self.swept = set()
                     self.init_button_list()
-                    threading.Thread(target=self.update_main_buttons, daemon=True).start()
+                    current_row = 0
+                    threading.Thread(target=self.discover_in_background, daemon=True).start()
+                elif selected == 'Sweep subnets':
+                    if self.sweep_status:
+                        self.set_status("Please wait, until the current sweep is done", 3)
+                        continue
+                    cidrs = PopupInput(stdscr, "Sweep subnets", "CIDR ranges: ", 60).draw()
+                    if cidrs:
+                        cidrs = [cidr.strip() for cidr in cidrs.split(",") if cidr.strip()]
+                        threading.Thread(target=self.sweep_subnets, args=(cidrs,), daemon=True).start()
                 elif selected == "[...loading]":
                     self.set_status("Please wait, until the component is connected", 3)
                 elif selected == "Autosetup Menu":
-                    if any(info == '[...loading]' for info in self.buttons.values()):
+                    if any(ip not in self.all_components for ip in self.ip_list):
                         self.set_status("Please wait, until all components are connected", 3)
                     else:
                         try:
@@ -140,13 +235,12 @@ class Menu:
                 else:
                     logger.debug(f"User selected {selected}.")
                     comp_if = CompIF()
-                    comp_info = comp_if.get_component_info(selected)
+                    comp_info = comp_if.get_component_info(selected, selected in self.swept)
                     # Check, if the component can be connected to
                     if comp_info["Identifier"]:
                         ComponentMenu(comp_info, self.simulation).run(stdscr)
                     else:
                         self.set_status("Unable to connect to component")
-                        stdscr.refresh()
                     current_row = 0 # After returning, select current row
 
 def main():
@@ -156,9 +250,9 @@ def main():
     Program's entry point.
     """
     logging.getLogger(__name__)
-    Components = CompIF()
-    ip_list = Components.discover()
-    menu = Menu(ip_list)
+    # Start from the last discovery, components are discovered and revalidated in the background
+    ip_list = COMPONENT_CACHE.discovered()
+    menu = Menu(ip_list, rediscover=True)
     try:
         curses.wrapper(menu.run_main_menu)
     except curses.error:
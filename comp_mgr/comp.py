@@ -1,33 +1,66 @@
 """
 Component Module
 
-All Component data and methods are stored in these class instances
+All Component data and methods are stored in these class instances.
+AsyncRorze communicates with a component on an asyncio stream, Rorze is the synchronous
+session of the menus, which runs the coroutines of an AsyncRorze on a shared event loop.
 
 When new components are added, they must be implemented individually here for:
-- setting IP address (change_IP)
-- setting TCP/IP port (set_host_port)
-- setting log host (set_log_host)
-- reading a backup (read_data)
+- setting IP address (ip_parameters)
+- setting TCP/IP port (host_port_parameters)
+- setting log host (log_host_parameters)
+- reading a backup (backup_plan)
 """
+import asyncio
+import functools
+import inspect
 import logging
 import ipaddress
 import os
 import socket
 import sys
 import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from comp_mgr.backup_format import EXTENSION, BackupWriter, section_name
+from comp_mgr.block_store import BlockStore
+from comp_mgr.capture import RECORDER
+from comp_mgr import planner
 from comp_mgr.exceptions import NoSystem, Unhandled
 from datetime import datetime
 from pathlib import Path
-from typing import TextIO, Union
+from typing import Callable
 from comp_mgr.config import PREALIGNERS, LOADPORTS, ROBOTS, OTHER
+from comp_mgr.desired_state import DesiredState
+from comp_mgr.log import FRAMES
+from comp_mgr.metrics import METRICS
+from comp_mgr.progress import Progress
 
 logger = logging.getLogger(__name__)
-    
-class Rorze():
+
+class RorzeBase():
+    """
+    Component data and command building of a session.
+    Nothing in here communicates with the component.
+
+    Parameter changes are lists of (parameter, value) tuples, e.g. ("DEQU.STDT[1]", 12000),
+    which are sent as '{read_name()}.{parameter}={value}'.
+    """
 
     TIMEOUT = 1
     MOTION_TIMEOUT = 12
     CNCT_TIMEOUT = 5
+    WTDT_TIMEOUT = 60
+    # Pipelined reads: number of outstanding commands on the socket, tuned between these
+    PIPELINE_WINDOW = 8
+    PIPELINE_MAX_WINDOW = 64
+    # Replies per round of the window tuning, and the change of the throughput between
+    # two rounds, which counts as a drop
+    PIPELINE_ROUND = 64
+    PIPELINE_DROP = 0.1
+    # Get commands, which read the value written by a set command
+    GET_COMMANDS = {"STDT": "GTDT", "STDA": "GTDA", "SPRM": "GPRM", "SEPM": "GEPM"}
 
     def __init__(self, comp_info: dict, simulation:bool = False):
         self.ip = comp_info["IP"]
@@ -38,106 +71,702 @@ class Rorze():
         # Display name for CLI (e.g. 'Rorze eTRB0')
         self.display_name = f"Rorze {self.type}"
         # Name of the component in Rorze terms (e.g. 'TRB0')
-        self.name = comp_info["Name"]
+        self.name = comp_info.get("Name")
         # Serial number of the component (if it exists)
-        self.sn = comp_info["SN"]
+        self.sn = comp_info.get("SN")
         # Component Type (e.g. "RA320_003")
-        self.identifier = comp_info["Identifier"]
+        self.identifier = comp_info.get("Identifier")
         # Firmware Version
-        self.firmware = comp_info["Firmware"]
+        self.firmware = comp_info.get("Firmware")
+        # Name, SN, Identifier and Firmware are unknown until the component is identified
 
         self.simulation = simulation
 
+        # Called whenever the status changes, e.g. to wake up the UI
+        self.on_change = None
         self.status = "Initializing..."
         logger.info(f"Initializing {self.display_name}...")
-        self.lock = threading.Lock()
         self.busy = False
+        # Window for pipelined reads, tuned during send_and_read_pipelined
+        self.pipeline_window = self.PIPELINE_WINDOW
+        self.pipeline_drops = 0
+        # Transactions: nesting depth, original values of the changed parameters and
+        # whether a flash write was requested inside the transaction
+        self.transaction_depth = 0
+        self.transaction_originals = {}
+        self.transaction_dirty = False
+        # Progress of the running bulk operation (e.g. a backup), see track
+        self.progress = None
+        # Latencies, bytes and errors of the communication, kept per IP for the whole program
+        self.metrics = METRICS.component(self.ip, self.name)
+        # Recording of the traffic, if enabled, see capture.RECORDER
+        self.capture = None
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, status: str) -> None:
+        self._status = status
+        if self.on_change is not None:
+            self.on_change()
 
-        self.establish_connection(self.simulation)
+    def read_name(self):
+        """
+        Rorze components will have a prefix that contain type information.
+        This prefix has to have a character removed, such that commands can be sent.
+        Example: extended_type="eTRB0" -> type="TRB0"
+        """
+        name = "o"+self.name[-4:]
+        return name
 
-    def establish_connection(self,port=12100):
+    def tune_pipeline_window(self, throughput: float, last_throughput: float) -> None:
+        """
+        Tune the pipeline window on the throughput (replies per second) of a round of
+        PIPELINE_ROUND replies, compared to the round before: As long as it does not drop, the
+        window doubles. If it drops in two rounds in a row (a single slow round is mostly a hiccup
+        of the host), the window is halved again, but never below PIPELINE_WINDOW.
+        The RTT of single replies is no measure, it includes the time spent on the replies before.
+        """
+        if throughput >= last_throughput * (1 - self.PIPELINE_DROP):
+            self.pipeline_drops = 0
+            self.pipeline_window = min(self.pipeline_window * 2, self.PIPELINE_MAX_WINDOW)
+            return
+        self.pipeline_drops += 1
+        if self.pipeline_drops >= 2:
+            self.pipeline_drops = 0
+            self.pipeline_window = max(self.pipeline_window // 2, self.PIPELINE_WINDOW)
 
+    def get_parameter(self, parameter: str) -> tuple[str, str]:
+        """
+        The get command and its reply prefix for a set parameter,
+        e.g. 'DCFG.STDT[5]' -> ('oTRB0.DCFG.GTDT[5]', 'aTRB0.DCFG.GTDT:')
+        """
+        for set_command, get_command in self.GET_COMMANDS.items():
+            head, found, index = parameter.partition(set_command)
+            if found:
+                return f"{self.read_name()}.{head}{get_command}{index}", f"a{self.name}.{head}{get_command}:"
+        raise Unhandled(f"No get command for parameter {parameter}")
+
+    def set_prefix(self, parameter: str) -> str:
+        """Reply prefix of a set parameter, e.g. 'DCFG.STDT[5]' -> 'aTRB0.DCFG.STDT'"""
+        for set_command in self.GET_COMMANDS:
+            head, found, _ = parameter.partition(set_command)
+            if found:
+                return f"a{self.name}.{head}{set_command}"
+        raise Unhandled(f"Unknown set command in parameter {parameter}")
+
+    def normalize_value(self, value) -> list:
+        """
+        Split a value into its fields, numbers compare equal regardless of format
+        ('+0000000005' == 5) and whether they are quoted ('"001"' == 1)
+        """
+        fields = []
+        for field in str(value).split(","):
+            field = field.strip().strip('"')
+            try:
+                fields.append(int(field))
+            except ValueError:
+                fields.append(field)
+        return fields
+
+    def changed_parameters(self, parameters: list[tuple[str, object]], current: list) -> list[tuple[str, object]]:
+        """The parameters whose value differs from the current one (None means unknown)"""
+        return [(parameter, value) for (parameter, value), current_value in zip(parameters, current)
+                if current_value is None or self.normalize_value(value) != self.normalize_value(current_value)]
+
+    def record_originals(self, changed: list[tuple[str, object]], parameters: list[tuple[str, object]], current: list) -> None:
+        """Remember the values before the first change inside a transaction, for the rollback"""
+        if not self.transaction_depth:
+            return
+        changed_parameters = {parameter for parameter, _ in changed}
+        for (parameter, _), value in zip(parameters, current):
+            if parameter in changed_parameters and value is not None:
+                self.transaction_originals.setdefault(parameter, value)
+
+    def begin_transaction(self) -> None:
+        self.transaction_depth += 1
+        if self.transaction_depth == 1:
+            self.transaction_originals = {}
+            self.transaction_dirty = False
+
+    def end_transaction(self) -> tuple[bool, list[tuple[str, object]]]:
+        """
+        Leave a transaction. Returns whether the outermost transaction ended with changes
+        and the original values of the changed parameters.
+        """
+        self.transaction_depth = max(self.transaction_depth - 1, 0)
+        if self.transaction_depth:
+            return False, []
+        originals = list(self.transaction_originals.items())
+        pending = self.transaction_dirty or bool(originals)
+        self.transaction_originals = {}
+        self.transaction_dirty = False
+        return pending, originals
+
+    @contextmanager
+    def track(self, operation: str, total: int):
+        """
+        Report the progress of a bulk operation of total commands in self.progress.
+        Every reply received meanwhile counts as one step, see progress.Progress.
+        """
+        outer = self.progress
+        progress = Progress(operation, total)
+        self.progress = progress
+        try:
+            yield progress
+        finally:
+            progress.finish()
+            logger.debug(f"{self.name} {progress.summary()}")
+            self.progress = outer
+
+    def identity(self) -> dict:
+        """The part of comp_info that is read from the component"""
+        return {"Name": self.name, "SN": self.sn, "Identifier": self.identifier, "Firmware": self.firmware}
+
+    def not_implemented(self):
+        status = f"Component type {self.identifier} has not been implemented"
+        self.status = status
+        logger.error(status)
+
+    def convert_IP(self, ip):
+        """Convert ip from string into Rorze int format, in which octets are reversed"""
+        # Convert "1.2.3.4" into int("4.3.2.1")
+        new_ip_int = int(ipaddress.IPv4Address(".".join(f'{ip}'.split('.')[::-1])))
+        return new_ip_int
+
+    def get_backup_dir(self):
+        """Makes sure, that Pyinstaller doesn't reset the cwd"""
+        if getattr(sys, "frozen", False):
+            return Path(sys.executable).parent
+        else:
+            return Path(__file__).resolve().parent.parent
+
+    def backup_store(self) -> BlockStore:
+        """All backups are stored deduplicated next to the executable, see block_store"""
+        return BlockStore(self.get_backup_dir() / "backups")
+
+    def backup_name(self, store: BlockStore, suffix="") -> str:
+        # Timestamp
+        ts = datetime.now().strftime("%Y%m%d")
+        # Never overwrite a previous backup, the catalog knows the highest index of the day
+        index = store.catalog.next_index(self.sn, ts, suffix)
+        # .dat files of older versions have the same names
+        while (self.get_backup_dir() / f"{self.identifier[:5]}_{self.sn}_{ts}_{index}{suffix}.dat").exists():
+            index += 1
+        return f"{self.identifier[:5]}_{self.sn}_{ts}_{index}{suffix}"
+
+    def backup_header(self, suffix="") -> dict:
+        """Identity of the component, stored in the header of the backup container"""
+        return {"IP": self.ip, "Name": self.name, "SN": self.sn, "Identifier": self.identifier,
+                "Firmware": self.firmware, "Suffix": suffix, "Time": datetime.now().isoformat(timespec="seconds")}
+
+    # ========== Define parameters here ==========
+
+    def basic_settings_values(self):
+        """System-specific host IP, TCP/IP port and log host"""
+        host_ip = -1
+        port = 12000
+        if self.system == "WMC":
+            log_host = "192.168.30.1"
+        elif self.system == "SEMDEX":
+            log_host = "192.168.0.10"
+        else:
+            logger.error("No system found in configuration")
+            raise NoSystem
+        return host_ip, port, log_host
+
+    def ip_parameters(self, ip):
+        # Implement different component types here
+        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
+            return [("STDT[1]", ip)]
+        elif self.identifier in PREALIGNERS:
+            return [("DEQU.STDT[3]", ip)]
+        return None
+
+    def aligner_speed_parameters(self, alignment_acceleration, alignment_speed):
+        return [
+            # Acceleration, speed and deceleration for alignment operation
+            ("DRCS.STDT[003][10]", alignment_acceleration),
+            ("DRCS.STDT[003][11]", alignment_speed),
+            ("DRCS.STDT[003][12]", alignment_acceleration),
+        ]
+
+    def body_no_parameters(self, body_no):
+        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, PREALIGNERS]):
+            return [("DEQU.STDT[6]", body_no)]
+        return None
+
+    def body_no_IP(self, body_no):
+        """If Body No. >1 - The IP changes according to the body no."""
+        if body_no > 1:
+            if self.system == "WMC":
+                return f"192.168.30.1{body_no}0"
+            elif self.system == "SEMDEX":
+                return f"192.168.0.2{body_no}"
+        return None
+
+    def flip_near_value(self, software_switch: int, setting) -> int:
+        # Flip the 28th bit, which corresponds to the 'flip finger near' setting
+        if setting == "Off":
+            software_switch |= (1 << 28)
+        elif setting == "On":
+            software_switch &= ~(1 << 28)
+        else:
+            logger.error("Unhandled exception")
+            raise Unhandled
+        return software_switch
+
+    def host_interface_parameters(self):
+        return [("DEQU.STDT[5]", "001")]
+
+    def host_IP_parameters(self, ip):
+        return [("DEQU.STDT[1]", ip)]
+
+    def host_port_parameters(self, port):
+        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
+            return [("DEQU.STDT[68]", port)]
+        elif self.identifier in PREALIGNERS:
+            return [("DEQU.STDT[2]", port)]
+        return None
+
+    def loadport_parameters(self):
+        """Sets the bits for system data according to checklists (last updated: 2026-02-20)"""
+        if self.identifier == "RV201-F07-000":
+            # Sets bits 18 (Presence LED) 4 (Auto Output) and 3 (I/O)
+            return [("DEQU.STDT[8]", 299129)]
+        return []
+
+    def log_host_parameters(self, ip):
+        if self.identifier in PREALIGNERS:
+            return [("DEQU.STDT[4]", ip)]
+        elif any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
+            # Convert ip to int following rorze method
+            return [("DEQU.STDT[69]", self.convert_IP(ip))]
+        return None
+
+    def no_interpolation_parameters(self):
+        case_1 = '"","","","","",00003,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000'
+        case_2 = '"","","","","",00000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000'
+        return [(f"DCFG.STDT[{idx}]", case_1 if idx in [0,10,11,12,13] else case_2) for idx in range(400)]
+
+    def notch_angle_parameters(self, notch_angle):
+        if self.identifier == "RA320_003":
+            return [("DALN.STDT[0][17]", notch_angle)]
+        elif self.identifier in ["RA320_002", "RA321_001"]:
+            return [("DALN.STDT[0][14]", notch_angle)]
+        elif self.identifier == "RA420_001":
+            return [(f"DALN.STDT[{work}][14]", notch_angle) for work in range(3)]
+        return []
+
+    def spindle_fix_parameters(self):
+        return [("DALN.STDT[0][37]", 100), ("DALN.STDT[0][38]", 100)]
+
+    # ========== Define backups here ==========
+
+    def backup_plan(self, facts: dict | None = None) -> list[tuple[str, list[tuple[str, str]]]]:
+        """
+        This serves the same purpose as the 'Read Data' button in the
+        Rorze maintenance software. It is slightly different for each component.
+
+        Returns the blocks of a backup in file order, compiled from config.BACKUP_SCHEMAS.
+        Each block is a tuple of the reply prefix and its rows, each row is a tuple of the
+        get command and the start of the line in the backup file.
+        Robot backups depend on facts read from the robot, see planner.FACTS.
+        """
+        return planner.compile_plan(self.name, self.identifier, facts)
+
+    def fact_parameters(self) -> list[tuple[str, None]]:
+        """Parameters that have to be read before the backup can be planned"""
+        return [(planner.FACTS[fact], None) for fact in planner.required_facts(self.identifier)]
+
+    def backup_line(self, prefix: str, line_start: str, reply: str) -> str:
+        """Turn the reply to a get command into a line of the backup file"""
+        # Cut Prefix from reply
+        if not prefix == reply[:len(prefix)]:
+            e = f"Mismatch between sent command and received command: {reply} / {prefix}"
+            raise Exception(e)
+        return f"{line_start}{reply[len(prefix):]}"
+
+class AsyncRorze(RorzeBase):
+    """
+    Session with a Rorze component on an asyncio stream. One event loop can drive many
+    components at once, without a thread per socket. Every call that waits for the component
+    takes an optional timeout in seconds.
+
+    Example:
+        component = AsyncRorze(comp_info)
+        await component.establish_connection()
+        await component.set_host_port(12000)
+        await component.read_data(suffix='_ORG', pipelined=True)
+    """
+
+    # Longest reply the stream accepts, DTRB/DAXM rows can be long
+    STREAM_LIMIT = 2**20
+
+    def __init__(self, comp_info: dict, simulation:bool = False):
+        super().__init__(comp_info, simulation)
+        self.lock = asyncio.Lock()
+        self.connected = False
+        self.reader = None
+        self.writer = None
+
+    async def establish_connection(self, port=12100, timeout=None, sock: socket.socket | None = None) -> bool:
+        """
+        Rorze specific connection that opens a socket and waits for an acknowledgement 'CNCT'.
+        An already connected socket (e.g. from the discovery probe) is taken over instead.
+        """
         if self.simulation:
             logger.warning("Simulation mode, generating data from config dict!")
-            return
+            self.connected = True
+            return True
 
-        """ Rorze specific connection that opens a socket and waits for an acknowledgement 'CNCT' """
+        timeout = self.CNCT_TIMEOUT if timeout is None else timeout
         self.status = "Connecting..."
         logger.info(f"Connecting to {self.display_name}...")
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.settimeout(self.CNCT_TIMEOUT)
+        if self.capture is not None:
+            self.capture.close()
+        self.capture = RECORDER.open(self.ip, port)
         try:
-            logger.debug(f"Rorze.establish_connection() -> Connecting to {self.ip}:{port}")
-            self.sock.connect((self.ip, port))
-            read = str(self.sock.recv(1024))[2:-3]
-            logger.debug(f"Rorze.establish_connection() -> Recieved: {read}")
+            async with asyncio.timeout(timeout):
+                if sock is None:
+                    logger.debug(f"AsyncRorze.establish_connection() -> Connecting to {self.ip}:{port}")
+                    self.reader, self.writer = await asyncio.open_connection(self.ip, port, limit=self.STREAM_LIMIT)
+                else:
+                    self.reader, self.writer = await asyncio.open_connection(sock=sock, limit=self.STREAM_LIMIT)
+                # Commands are short, don't let Nagle hold them back while replies are outstanding
+                self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                read = await self.read_message()
+            logger.debug(f"AsyncRorze.establish_connection() -> Recieved: {read}")
 
             # Store component type!
             self.type = read.split('.')[0]
 
-            message = read.split('.')[1]
-
-            if "CNCT" in message:
+            if read.endswith(".CNCT"):
+                self.connected = True
                 self.status = f"{self.type} is connected"
                 logger.info(f"Connection to {self.display_name} successful")
-        except socket.timeout:
+        except TimeoutError as e:
+            self.metrics.error(e)
             self.status = "ERROR: Connection Timeout"
             logger.error("Connection Timeout")
-            self.busy = True
-        except socket.error as e:
-            self.busy = True
+        except OSError as e:
+            self.metrics.error(e)
             self.status = f"Socket error: {e}"
             logger.error(f"Socket error: {e}")
-        finally:
-            self.busy = False
-
-        self.sock.settimeout(self.TIMEOUT)
-
-    def close_connection(self):
-        self.sock.close()
-    
-    def recv_until_newline(self):
-        data = b""
-        while True:
-            chunk = self.sock.recv(1024)
-            if not chunk:
-                break  # connection closed
-            data += chunk
-            if (b"\r" in chunk):
-                break
-        return data.decode('utf-8').strip()
-
-    def send_and_read(self, command: str, buffer: int=1024) -> str:
+        return self.connected
+
+    async def close_connection(self):
+        if self.simulation:
+            return
+        self.connected = False
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError as e:
+                logger.debug(f"AsyncRorze.close_connection() -> {self.ip}: {e}")
+        if self.capture is not None:
+            self.capture.close()
+
+    async def identify(self, known: dict | None = None) -> bool:
+        """
+        Read name, serial number, component type and firmware version from the component.
+        Example GVER: aTRB0.GVER:RORZE STD_TRB RR754 Ver 1.19U (2020/12/17)
+        If known (a cached comp_info) has the same CNCT banner and serial number, its component
+        type and firmware are taken over instead of reading GVER again. The serial number is
+        always read: new units share the banner and the factory default IP of the previous one.
+        Returns False, if the component is not a known Rorze component.
+        """
+        if not self.connected or not any(p in self.type for p in ['TRB','ALN','STG','TBL']):
+            return False
+
+        # The CNCT message starts with the name, e.g. 'eTRB0'
+        self.name = self.type[1:]
+        serial_number = await self.send_and_read(f"o{self.name}.DEQU.GTDT[0]")
+        self.sn = serial_number.split('"')[1]
+        if known and known.get("Banner") == self.type and known.get("SN") == self.sn and known.get("Identifier"):
+            self.identifier = known["Identifier"]
+            self.firmware = known["Firmware"]
+            logger.info(f"{self.ip} - Component type unchanged: Rorze {self.identifier}")
+        else:
+            verstring = (await self.send_and_read(f"o{self.name}.GVER")).split(':')[1]
+            self.identifier = verstring.split(" Ver ")[0].split(" ")[-1]
+            self.firmware = verstring.split(" Ver ")[1][:5]
+            logger.info(f"{self.ip} - Component type detected: Rorze {self.identifier}")
+
+        self.metrics.name = self.name
+        # If prealigner, set the status events to off (done by maintenance software)
+        await self.send_and_read(f"o{self.name}.EVNT(0,0)")
+        return True
+
+    async def read_message(self) -> str:
+        """Read one '\r'-terminated frame"""
+        try:
+            frame = await self.reader.readuntil(b"\r")
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Connection closed by component")
+        if self.capture is not None:
+            self.capture.received(frame[:-1])
+        return frame.decode('utf-8').strip()
+
+    def write(self, data: bytes) -> None:
+        self.writer.write(data)
+        if self.capture is not None:
+            self.capture.sent(data)
+
+    async def send_and_read(self, command: str, timeout=None) -> str:
         command = f"{command}\r" # \r required to send
 
         if self.simulation:
             logger.debug(f"(SIM) Sending: {command}")
             return "(SIM) Response"
 
-        with self.lock:
+        timeout = self.TIMEOUT if timeout is None else timeout
+        async with self.lock:
             self.busy = True
-            logger.debug(f"Sending: {command}")
-            self.sock.sendall(command.encode('utf-8')) 
-            try: 
-                read = self.recv_until_newline()
-                logger.debug(f"Receive: {read}")
-                message = read
-            except socket.error as e:
+            try:
+                FRAMES.sent(self.ip, command)
+                start = time.monotonic()
+                self.write(command.encode('utf-8'))
+                async with asyncio.timeout(timeout):
+                    await self.writer.drain()
+                    message = await self.read_message()
+                self.metrics.observe(command, time.monotonic() - start, len(command), len(message) + 1)
+                FRAMES.received(self.ip, message)
+                if self.progress:
+                    self.progress.step(len(message))
+            except TimeoutError as e:
+                self.metrics.error(e)
+                self.status = "ERROR: Timeout"
+                logger.error(f"Timeout: {command}")
+                raise
+            except OSError as e:
+                self.metrics.error(e)
                 self.status = f"Socket error: {e}"
                 logger.error(f"Socket error: {e}")
+                raise
             finally:
                 self.busy = False
-        
+
         return message
 
+    async def send_and_read_pipelined(self, commands: list[str], prefix: str | list[str],
+                                      handle: Callable[[int, str], None] | None = None, timeout=None) -> list[str]:
+        """
+        Send a list of commands while keeping a window of them outstanding on the stream.
+        Replies are matched to the commands by their prefix (e.g. 'aTRB0.DTRB.GTDA'), either one
+        for all commands or one per command. Events in between are skipped, any other reply that
+        does not answer the oldest outstanding command raises a mismatch.
+        Each reply is passed to handle(index, reply) as soon as it arrives, e.g. to stream a backup,
+        or collected and returned in the order of the commands. The session lock is only held
+        inside this call, handle must not use the session itself. See tune_pipeline_window.
+        The timeout applies to every single reply.
+        """
+        if self.simulation:
+            replies = []
+            for i, command in enumerate(commands):
+                logger.debug(f"(SIM) Sending: {command}")
+                if handle is not None:
+                    handle(i, "(SIM) Response")
+                else:
+                    replies.append("(SIM) Response")
+            return replies
+
+        timeout = self.TIMEOUT if timeout is None else timeout
+        prefixes = [prefix] * len(commands) if isinstance(prefix, str) else prefix
+
+        async with self.lock:
+            self.busy = True
+            pending = deque()  # (command, reply prefix, send time) of outstanding commands
+            replies = []
+            next_command = 0
+            answered = 0
+            # Rounds of PIPELINE_ROUND replies, see tune_pipeline_window
+            round_start = time.monotonic()
+            round_answered = 0
+            last_throughput = None
+            try:
+                while next_command < len(commands) or pending:
+                    # Fill the window, sending all new commands in one packet
+                    batch = []
+                    while next_command < len(commands) and len(pending) < self.pipeline_window:
+                        command = commands[next_command]
+                        FRAMES.sent(self.ip, command)
+                        batch.append(f"{command}\r")
+                        pending.append((command, prefixes[next_command], time.monotonic()))
+                        next_command += 1
+                    async with asyncio.timeout(timeout):
+                        if batch:
+                            self.write("".join(batch).encode('utf-8'))
+                            await self.writer.drain()
+                        read = await self.read_message()
+                    FRAMES.received(self.ip, read)
+                    if read.startswith("e"):
+                        # Events do not answer a command
+                        logger.debug(f"Ignoring event during pipelined read: {read}")
+                        self.metrics.unexpected += 1
+                        continue
+
+                    command, expected, sent = pending.popleft()
+                    if not read.startswith(expected):
+                        e = f"Mismatch between sent command and received command: {command} / {read}"
+                        raise Exception(e)
+
+                    now = time.monotonic()
+                    self.metrics.observe(command, now - sent, len(command) + 1, len(read) + 1)
+                    round_answered += 1
+                    if round_answered >= self.PIPELINE_ROUND:
+                        throughput = round_answered / max(now - round_start, 1e-6)
+                        if last_throughput is not None:
+                            self.tune_pipeline_window(throughput, last_throughput)
+                        round_start, round_answered, last_throughput = now, 0, throughput
+                    if self.progress:
+                        self.progress.step(len(read))
+
+                    if handle is not None:
+                        handle(answered, read)
+                    else:
+                        replies.append(read)
+                    answered += 1
+            except TimeoutError as e:
+                self.metrics.error(e)
+                self.status = "ERROR: Timeout"
+                logger.error(f"Timeout during pipelined read ({pending[0][0] if pending else commands[-1]})")
+                raise
+            except OSError as e:
+                self.metrics.error(e)
+                self.status = f"Socket error: {e}"
+                logger.error(f"Socket error: {e}")
+                raise
+            finally:
+                # Collect replies that are still on their way, so the next command reads its own reply
+                for _ in range(len(pending)):
+                    try:
+                        async with asyncio.timeout(timeout):
+                            await self.read_message()
+                    except OSError:
+                        break
+                logger.debug(f"Pipeline window: {self.pipeline_window}")
+                self.busy = False
+
+        return replies
+
+    async def send_and_read_runs(self, commands: list[str], prefixes: list[str], timeout=None) -> list[str]:
+        """Send commands, pipelining every run of commands with the same reply prefix"""
+        replies = []
+        start = 0
+        while start < len(commands):
+            end = start + 1
+            while end < len(commands) and prefixes[end] == prefixes[start]:
+                end += 1
+            if end - start > 1:
+                replies += await self.send_and_read_pipelined(commands[start:end], prefixes[start], timeout=timeout)
+            else:
+                replies.append(await self.send_and_read(commands[start], timeout))
+            start = end
+        return replies
+
+    async def set_parameters(self, parameters: list[tuple[str, object]], pipelined=False, timeout=None) -> list[str]:
+        """Send a list of (parameter, value) changes, see RorzeBase"""
+        commands = [f"{self.read_name()}.{parameter}={value}" for parameter, value in parameters]
+        if pipelined:
+            prefixes = [self.set_prefix(parameter) for parameter, _ in parameters]
+            return await self.send_and_read_runs(commands, prefixes, timeout)
+        return [await self.send_and_read(command, timeout) for command in commands]
+
+    async def read_parameters(self, parameters: list[tuple[str, object]], timeout=None) -> list[str | None]:
+        """Read the current values of the parameters in one pipelined batch (None in simulation)"""
+        if self.simulation:
+            return [None] * len(parameters)
+
+        gets = [self.get_parameter(parameter) for parameter, _ in parameters]
+        commands = [command for command, _ in gets]
+        prefixes = [prefix for _, prefix in gets]
+        # The pipelined read matches replies without the ':'
+        replies = await self.send_and_read_runs(commands, [prefix[:-1] for prefix in prefixes], timeout)
+        return [self.backup_line(prefix, "", reply) for prefix, reply in zip(prefixes, replies)]
+
+    async def read_facts(self, timeout=None) -> dict:
+        """Facts the backup plan depends on, see planner.FACTS"""
+        parameters = self.fact_parameters()
+        if not parameters:
+            return {}
+        values = await self.read_parameters(parameters, timeout)
+        facts = {fact: int(value or 0) for fact, value in zip(planner.required_facts(self.identifier), values)}
+        logger.debug(f"Backup facts: {facts}")
+        return facts
+
+    async def set_changed_parameters(self, parameters: list[tuple[str, object]], timeout=None) -> list[tuple[str, object]]:
+        """Read the parameters and only send the ones that differ. Returns the changed parameters"""
+        with self.track("Reading parameters", len(parameters)):
+            current = await self.read_parameters(parameters, timeout)
+        changed = self.changed_parameters(parameters, current)
+        self.record_originals(changed, parameters, current)
+        if changed:
+            with self.track("Writing parameters", len(changed)):
+                await self.set_parameters(changed, pipelined=True, timeout=timeout)
+        logger.debug(f"{len(changed)} of {len(parameters)} parameters changed")
+        return changed
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Collect all parameter changes made inside and write them to flash once, on commit:
+            async with component.transaction():
+                await component.set_body_no(2)
+                await component.set_log_host(ip)
+        If anything fails, the changed parameters are set back to their original values.
+        Transactions can be nested, only the outermost one writes to flash.
+        """
+        self.begin_transaction()
+        try:
+            yield self
+        except BaseException:
+            if self.transaction_depth > 1:
+                self.end_transaction()
+                raise
+            try:
+                await self.rollback()
+            except Exception as e:
+                logger.error(f"Rollback failed: {e}")
+            raise
+        await self.commit()
+
+    async def commit(self) -> None:
+        """Write the changes of the transaction to flash, with a single WTDT"""
+        pending, originals = self.end_transaction()
+        if pending:
+            logger.info(f"Committing {len(originals)} changed parameters")
+            await self.write_changes()
+
+    async def rollback(self) -> None:
+        """Set the parameters changed in the transaction back, nothing is written to flash"""
+        self.transaction_depth = 1
+        _, originals = self.end_transaction()
+        if originals:
+            logger.warning(f"Rolling back {len(originals)} changed parameters")
+            await self.set_parameters(originals, pipelined=True)
+            self.status = f"Rolled back {len(originals)} changes"
+
+    async def apply_parameters(self, parameters: list[tuple[str, object]], write=1, timeout=None) -> list[tuple[str, object]]:
+        """
+        Bring the parameters to their target values, see DesiredState.
+        Nothing is written to flash, if every value was already correct.
+        """
+        changed = await self.set_changed_parameters(parameters, timeout)
+        if write and changed: await self.write_changes()
+        return changed
+
     # Motion commands - not planned yet
     # def send_and_read_motion(self,command,buffer=1024):
-        
+
     #     with self.lock: # THIS SHOULD NOT BLOCKING -- EMO NEEDS TO BE POSSIBLE
     #         self.busy = True
     #         logger.debug(f"Sending: {command}")
     #         self.sock.sendall(command.encode('utf-8'))
-    #         try: 
+    #         try:
     #             read = self.recv_until_newline()
     #             message = read #.split('.')[1]
     #             self.status = "Component is in motion..."
@@ -153,24 +782,15 @@ class Rorze():
     #             logger.error(f"Socket error: {e}")
     #         finally:
     #             self.busy = False
-            
+
     #         self.status = f"Motion completed {message}"
     #         logger.info(f"Motion completed {message}")
 
     #     return message
-    
-    def read_name(self):
-        """
-        Rorze components will have a prefix that contain type information.
-        This prefix has to have a character removed, such that commands can be sent.
-        Example: extended_type="eTRB0" -> type="TRB0"
-        """
-        name = "o"+self.name[-4:]
-        return name
 
     # ========== Define commands here ==========
 
-    def basic_settings(self, write=1):
+    async def basic_settings(self, write=1):
         """
         Basic settings to change for every component
         - TCP/IP Port
@@ -178,238 +798,147 @@ class Rorze():
         - Log Host
         + Component-Specific Stuff
         """
-        # System-Specific settings
-        host_ip = -1
-        port = 12000
-        if self.system == "WMC":
-            log_host = "192.168.30.1"
-        elif self.system == "SEMDEX":
-            log_host = "192.168.0.10"
-        else:
-            logger.error("No system found in configuration")
-            raise NoSystem
-
         # Component-specific settings
         if self.identifier in LOADPORTS:
             logger.info("Changing the following Loadport settings: TCP/IP Port | Host IP | Log Host | Auto Output | Presence LED | I/O")
-            self.set_loadport_settings(write)
-        
+
         elif self.identifier in PREALIGNERS:
             logger.info("Changing the following Prealigner settings: TCP/IP Port | Host IP | Log Host | Host Interface | Body no")
-            self.set_host_interface(write)
-            self.set_body_no(1,write)
 
         elif self.identifier in ROBOTS:
             logger.info("Changing the following Robot settings: TCP/IP Port | Host IP | Log Host")
-        
+
         elif self.identifier == "RTS13":
             logger.info("Changing the following Lineartrack settings: TCP/IP Port | Host IP | Log Host")
 
-        # Common Settings
-        self.set_host_IP(host_ip, write)
-        self.set_host_port(port, write)
-        self.set_log_host(log_host, write)
+        changed = await self.apply_parameters(DesiredState(self).basic_settings().parameters(), write)
+        self.status = f"Basic settings applied, {len(changed)} values changed"
 
-    def change_IP(self, ip, write=1):
-        # Implement different component types here
-        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
-            command = f"{self.read_name()}.STDT[1]={ip}"
-        elif self.identifier in PREALIGNERS:
-            command = f"{self.read_name()}.DEQU.STDT[3]={ip}"
-        else:
-            status = f"Component type {self.identifier} has not been implemented"
-            self.status = status
-            logger.error(status)
+    async def change_IP(self, ip, write=1):
+        parameters = self.ip_parameters(ip)
+        if parameters is None:
+            self.not_implemented()
             return
 
-        message = self.send_and_read(command)
-        if write: self.write_changes()
-        self.status = f"IP set to {ip}. Please restart the component. ({message})"
-    
-    def convert_IP(self, ip):
-        """Convert ip from string into Rorze int format, in which octets are reversed"""
-        # Convert "1.2.3.4" into int("4.3.2.1")
-        new_ip_int = int(ipaddress.IPv4Address(".".join(f'{ip}'.split('.')[::-1])))
-        return new_ip_int
+        if not await self.apply_parameters(parameters, write):
+            self.status = f"IP is already {ip}."
+            return
+        self.status = f"IP set to {ip}. Please restart the component."
 
-    def GAIO(self):
+    async def GAIO(self):
         command = f"{self.read_name()}.GAIO"
-        message = self.send_and_read(command)
+        message = await self.send_and_read(command)
         self.status = message
 
-    def get_backup_dir(self):
-        """Makes sure, that Pyinstaller doesn't reset the cwd"""
-        if getattr(sys, "frozen", False):
-            return Path(sys.executable).parent
-        else:
-            return Path(__file__).resolve().parent.parent
-
-    def get_host_IP(self):
+    async def get_host_IP(self):
         command = f"{self.read_name()}.DEQU.GTDT[1]"
-        ip = self.send_and_read(command)
+        ip = await self.send_and_read(command)
         return ip
 
-    def get_host_port(self):
+    async def get_host_port(self):
         if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
             command = f"{self.read_name()}.DEQU.GTDT[68]"
-            port = self.send_and_read(command)
+            port = await self.send_and_read(command)
             return port
         elif self.identifier in PREALIGNERS:
             command = f"{self.read_name()}.DEQU.GTDT[2]"
-            port = self.send_and_read(command)
+            port = await self.send_and_read(command)
             return port
         else:
             return None
 
-    def get_log_host(self):
+    async def get_log_host(self):
         if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
             command = f"{self.read_name()}.DEQU.GTDT[69]"
-            ip = self.send_and_read(command)
+            ip = await self.send_and_read(command)
             return ip
         elif self.identifier in PREALIGNERS:
             command = f"{self.read_name()}.DEQU.GTDT[4]"
-            ip = self.send_and_read(command)
+            ip = await self.send_and_read(command)
             return ip
         else:
             return None
 
-    def get_rotary_switch_value(self):
+    async def get_rotary_switch_value(self):
         command = f"{self.read_name()}.GTDT[3]"
-        message = self.send_and_read(command)
+        message = await self.send_and_read(command)
         self.status = f"Rotary switch position: {message}"
 
-    def get_status(self):
+    async def get_status(self):
         command = f"{self.read_name()}.STAT"
-        message = self.send_and_read(command)
+        message = await self.send_and_read(command)
         self.status = f"{message}"
 
-    def no_interpolation(self, write=1):
+    async def no_interpolation(self, write=1) -> int:
+        """Only rewrite the DCFG rows that differ. Returns the number of changed rows"""
         self.busy=True
         self.status="Applying no interpolation..."
-        case_1 = '"","","","","",00003,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000'
-        case_2 = '"","","","","",00000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000,+0000000000'
-        for idx in range(400):
-            command = f"{self.read_name()}.DCFG.STDT[{idx}]="
-            if idx in [0,10,11,12,13]:
-                command+=case_1
-            else:
-                command+=case_2
-            self.send_and_read(command)
-        if write: self.write_changes()
+        parameters = self.no_interpolation_parameters()
+        changed = await self.apply_parameters(parameters, write)
+        self.status = f"No interpolation: {len(changed)} of {len(parameters)} rows changed"
+        logger.info(self.status)
         self.busy=False
-    
-    def origin_search(self, p1: int=0, p2: int=0):
+        return len(changed)
+
+    async def origin_search(self, p1: int=0, p2: int=0):
         command = f"{self.read_name()}.ORGN({p1},{p2})"
-        message = self.send_and_read_motion(command)
+        message = await self.send_and_read_motion(command)
         self.status = f"Origin search completed: {message}"
 
-    def SAIO_on(self):
+    async def SAIO_on(self):
         command = f"{self.read_name()}.SAIO(00000000000000000000000100000010,00000000000000000000000000000000,0000000000)"
-        message = self.send_and_read(command)
+        message = await self.send_and_read(command)
         logger.debug(message)
         self.status = "Automatic status ON. Response logged."
 
-    def SAIO_off(self):
+    async def SAIO_off(self):
         command = f"{self.read_name()}.SAIO(00000000000000000000000000000000,00000000000000000000000000000000,0000000000)"
-        message = self.send_and_read(command)
+        message = await self.send_and_read(command)
         logger.debug(message)
         self.status = "Automatic status OFF. Response logged."
 
-    def set_aligner_speed(self, speed, write=1):
-        if speed == "Slow":
-            alignment_acceleration = 100000
-            alignment_speed = 30000
-        elif speed == "Normal":
-            # Leave as is, unless the speed has been set to slow before!
-            command = f"{self.read_name()}.DRCS.GTDT[003][10]"
-            alignment_acceleration = self.send_and_read(command)
-            command = f"{self.read_name()}.DRCS.GTDT[003][11]"
-            alignment_speed = self.send_and_read(command)
-            if alignment_acceleration == 100000 and alignment_speed == 30000:
-                logger.warning("Detected slow aligner setting. Restoring speed parameter.")
-                alignment_acceleration = 450000
-                alignment_speed = 120000
-            else:
-                return
-
-        # Set acceleration for alignment operation
-        command = f"{self.read_name()}.DRCS.STDT[003][10]={alignment_acceleration}"
-        self.send_and_read(command)
-        # Set speed for alignment operation
-        command = f"{self.read_name()}.DRCS.STDT[003][11]={alignment_speed}"
-        self.send_and_read(command)
-        # Set deceleration for alignment operation
-        command = f"{self.read_name()}.DRCS.STDT[003][12]={alignment_acceleration}"
-        self.send_and_read(command)
-        logger.info(f"Setting aligner speed to {alignment_speed} and acceleration to {alignment_acceleration}")
-        if write: self.write_changes()
-    
-    def set_body_no(self, body_no, write=1):
-        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, PREALIGNERS]):
-            command = f"{self.read_name()}.DEQU.STDT[6]={body_no}"
-            self.send_and_read(command)
-
-            # If Body No. >1 - Also change IP
-            if body_no > 1:
-                logger.info("Setting IP according to Body No")
-                if self.system == "WMC":
-                    self.change_IP(f"192.168.30.1{body_no}0")
-                elif self.system == "SEMDEX":
-                    self.change_IP(f"192.168.0.2{body_no}")
-            if write: self.write_changes()
-        else:
-            status = f"Component type {self.identifier} has not been implemented"
-            self.status = status
-            logger.error(status)
+    async def set_aligner_speed(self, speed, write=1):
+        """See DesiredState.aligner_speed"""
+        state = await DesiredState(self).aligner_speed(speed)
+        if await state.apply(write):
+            logger.info(f"Setting aligner speed: {', '.join(state.items)}")
+
+    async def set_body_no(self, body_no, write=1):
+        # If Body No. >1 - The IP is changed as well
+        if self.body_no_parameters(body_no) is None:
+            self.not_implemented()
             return
+
+        await self.apply_parameters(DesiredState(self).body_no(body_no).parameters(), write)
         self.status = f"Body no set to {body_no}"
 
-    def set_flip_near(self, setting, write=1):
-        software_switch = self.send_and_read(f"{self.read_name()}.DEQU.GTDT[8]")
-        logger.debug(f"Software_switch before cutting: {software_switch}")
-        software_switch = int(software_switch.split(":")[1])
-        logger.debug(f"Software_switch after cutting: {software_switch}")
-        # Flip the 28th bit, which corresponds to the 'flip finger near' setting
-        if setting == "Off":
-            software_switch |= (1 << 28)
-        elif setting == "On":
-            software_switch &= ~(1 << 28)
-        else:
-            logger.error("Unhandled exception")
-            raise Unhandled
-        self.send_and_read(f"{self.read_name()}.DEQU.STDT[8]={software_switch}")
-        logger.info(f"Setting robot software switch to {software_switch}")
-        if write: self.write_changes()
-    
-    def set_host_interface(self, write=1):
-        command = f"{self.read_name()}.DEQU.STDT[5]=001"
-        self.send_and_read(command)
-        if write: self.write_changes()
-    
-    def set_host_IP(self, ip, write=1):
-        command = f"{self.read_name()}.DEQU.STDT[1]={ip}"
-        self.send_and_read(command)
-        if write: self.write_changes()
+    async def set_flip_near(self, setting, write=1):
+        """See DesiredState.flip_near"""
+        state = await DesiredState(self).flip_near(setting)
+        if await state.apply(write):
+            logger.info(f"Setting robot software switch to {state.targets['DEQU.STDT[8]']}")
+
+    async def desired_state(self, config_list: dict) -> DesiredState:
+        """Targets of the Config_List of an autosetup, see DesiredState.from_config"""
+        return await DesiredState(self).from_config(config_list)
+
+    async def set_host_interface(self, write=1):
+        await self.apply_parameters(self.host_interface_parameters(), write)
+
+    async def set_host_IP(self, ip, write=1):
+        await self.apply_parameters(self.host_IP_parameters(ip), write)
         self.status = f"Host IP set to {ip}."
-    
-    def set_host_port(self, port, write=1):
-        if any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
-            command = f"{self.read_name()}.DEQU.STDT[68]={port}"
-            self.send_and_read(command)
-            if write: self.write_changes()
-        elif self.identifier in PREALIGNERS:
-            command = f"{self.read_name()}.DEQU.STDT[2]={port}"
-            self.send_and_read(command)
-            if write: self.write_changes()
-        else:
-            status = f"Component type {self.identifier} has not been implemented"
-            self.status = status
-            logger.error(status)
+
+    async def set_host_port(self, port, write=1):
+        parameters = self.host_port_parameters(port)
+        if parameters is None:
+            self.not_implemented()
             return
 
+        await self.apply_parameters(parameters, write)
         self.status = f"TCP/IP port set to {port}."
-    
-    def set_laser(self, arm, setting):
+
+    async def set_laser(self, arm, setting):
         if arm == 'lower':
             arm_no = 2
             if setting == 'on':
@@ -423,321 +952,167 @@ class Rorze():
             elif setting == 'off':
                 set_bit = 'D101B'
         command = f"{self.read_name()}.ARM{arm_no}.DCMD({set_bit},1)"
-        message = self.send_and_read(command)
-        self.GAIO()
+        message = await self.send_and_read(command)
+        await self.GAIO()
         self.status = f"{arm} arm laser turned {setting}. ({message})"
-    
-    def set_loadport_settings(self, write=1):
-        """Sets the bits for system data according to checklists (last updated: 2026-02-20)"""
-        if self.identifier == "RV201-F07-000":
-            # Sets bits 18 (Presence LED) 4 (Auto Output) and 3 (I/O)
-            command = f"{self.read_name()}.DEQU.STDT[8]=299129"
-            self.send_and_read(command)
-            if write: self.write_changes()
+
+    async def set_loadport_settings(self, write=1):
+        parameters = self.loadport_parameters()
+        if parameters:
+            await self.apply_parameters(parameters, write)
             self.status = "Set basic loadport settings"
-    
-    def set_log_host(self, ip, write=1):
-        if self.identifier in PREALIGNERS:
-            command = f"{self.read_name()}.DEQU.STDT[4]={ip}"
-            self.send_and_read(command)
-            if write: self.write_changes()
-        elif any(self.identifier in lst for lst in [ROBOTS, LOADPORTS, OTHER]):
-            # Convert ip to int following rorze method
-            ip_int = self.convert_IP(ip)
-            command = f"{self.read_name()}.DEQU.STDT[69]={ip_int}"
-            self.send_and_read(command)
-            if write: self.write_changes()
-        else:
-            status = f"Component type {self.identifier} has not been implemented"
-            self.status = status
-            logger.error(status)
+
+    async def set_log_host(self, ip, write=1):
+        parameters = self.log_host_parameters(ip)
+        if parameters is None:
+            self.not_implemented()
             return
 
+        await self.apply_parameters(parameters, write)
         self.status = f"Log host set to {ip}."
 
-    def set_notch_angle(self, notch_angle, write=1):
-        if self.identifier == "RA320_003":
-            command = f"{self.read_name()}.DALN.STDT[0][17]={notch_angle}"
-            self.send_and_read(command)
-        elif self.identifier in ["RA320_002", "RA321_001"]:
-            command = f"{self.read_name()}.DALN.STDT[0][14]={notch_angle}"
-            self.send_and_read(command)
-        elif self.identifier == "RA420_001":
-            for work in range(3):
-                command = f"{self.read_name()}.DALN.STDT[{work}][14]={notch_angle}"
-                self.send_and_read(command)
-        if write: self.write_changes()
-    
-    def spindle_fix(self, write=1):
-        command = f"{self.read_name()}.DALN.STDT[0][37]=100"
-        self.send_and_read(command)
-        command = f"{self.read_name()}.DALN.STDT[0][38]=100"
-        self.send_and_read(command)
-        if write: self.write_changes()
-
-    def write_changes(self):
+    async def set_notch_angle(self, notch_angle, write=1):
+        await self.apply_parameters(self.notch_angle_parameters(notch_angle), write)
+
+    async def spindle_fix(self, write=1):
+        await self.apply_parameters(self.spindle_fix_parameters(), write)
+
+    async def write_changes(self, timeout=None):
+        if self.transaction_depth:
+            # Written once, when the transaction is committed
+            self.transaction_dirty = True
+            self.status = "Changes pending until commit"
+            return
         self.status = "Writing to flash memory..."
         if self.simulation:
             return
-        self.sock.settimeout(60)
-        acknowledge = self.send_and_read(f"{self.read_name()}.WTDT")
+        timeout = self.WTDT_TIMEOUT if timeout is None else timeout
+        acknowledge = await self.send_and_read(f"{self.read_name()}.WTDT", timeout)
         logger.debug(f"Writing data to flash memory: {acknowledge}")
         self.status = "Changes saved to flash memory."
-        self.sock.settimeout(self.TIMEOUT)
-    
-    def read_data(self, suffix=""):
+
+    async def read_data(self, suffix="", pipelined=False, timeout=None) -> str | None:
         """
-        This serves the same purpose as the 'Read Data' button in the
-        Rorze maintenance software. It is slightly different for each component.
+        Create a backup from backup_plan in the backup store and return its name.
+        The .dat file for the Rorze maintenance software is written next to the store as well,
+        with the indexed container (see backup_format), which lacks its footer if the backup failed.
+        With pipelined=True, the rows of each block are requested through
+        send_and_read_pipelined instead of one round-trip per row.
         """
         self.status = "Reading data..."
-        
-        def read_ip_prefix(self, file):
-            IP = self.send_and_read(f"o{self.name}.GTDT[1]", 1000)
-            prefix = f"a{self.name}.GTDT:"
-            if not prefix == IP[:len(prefix)]:
-                e = f"Mismatch between sent command and received command: {IP}"
-                raise Exception(e)
-            IP = IP[len(prefix):]
-            print(f"STDT[1]={IP}", file=file)
-
-        def read_block(self,
-                       block_name: str,
-                       n: Union[int, list[int]],
-                       set_command: str,
-                       file: TextIO,
-                       add_brackets: bool=False,
-                       add_leading: bool=False) -> None:
-            """"Reads one block of component data, e.g. 5 lines of DRCS for the Robot"""
-            name = self.name
-            buffer = 2**20
-            get_command = f"G{set_command[1:]}" # Turns STDT into GTDT
-
-            # Turn the input of n into a list, even if it has just one element
-            if isinstance(n, int):
-                block_range = range(n)
-            else:
-                block_range = n
-
-            if len(block_range) == 1:
-                block = self.send_and_read(f"o{name}.{block_name}.{get_command}",buffer)
-
-                # Cut Prefix from block
-                prefix = f"a{name}.{block_name}.{get_command[:4]}:" # Cuts the bracket of the get command GTDT[000]
-                if not prefix == block[:len(prefix)]:
-                    e = f"Mismatch between sent command and received command: {block} / {prefix}"
-                    raise Exception(e)
-                block = block[len(prefix):]
-
-                set_string = f"{block_name}.{set_command}={block}"
-                
-                # Write to file
-                print(set_string, file=file)
-
-            else:
-                for i in block_range:
-                    if add_leading:
-                        idx = f"{i:03}"
-                    else:
-                        idx = i
-                    block = self.send_and_read(f"o{name}.{block_name}.{get_command}[{idx}]",buffer)
 
-                    # Cut Prefix from block
-                    prefix = f"a{name}.{block_name}.{get_command[:4]}:" # Cuts the bracket of the get command GTDT[000]
-                    if not prefix == block[:len(prefix)]:
-                        e = f"Mismatch between sent command and received command: {block} / {prefix}"
-                        raise Exception(e)
-                    block = block[len(prefix):]
-
-                    # Write to file
-                    print(f"{block_name}.{set_command}[{idx}]={block}", file=file)
-
-        def read_data_lineartrack(self,filename):
-            with open(f"{filename}", "x") as backup:
-                read_block(self,"DEQU", 1, "STDT", backup)
-                read_block(self,"DRES", 1, "STDT", backup)
-                read_block(self,"DRCI", 1, "STDT[0]", backup, add_brackets=True) # Lineartrack needs extra [0]
-                read_block(self,"DRCS", 1, "STDT[0]", backup, add_brackets=True)
-                read_block(self,"DRCH", 1, "STDT[0]", backup, add_brackets=True)
-                read_block(self,"DMNT", 1, "STDT[0]", backup, add_brackets=True)
-                read_block(self,"XAX1", [0,1,2,8,9,10,11,12,13,14,15,16,17,18,19,40], "STDT", backup)
-                read_block(self,"XAX1", 1, "SPRM", backup)
-                read_block(self,"XAX1", 16, "SEPM", backup)
-                read_block(self,"DTBL", 400, "STDA", backup)
-
-        def read_data_loadport(self,filename):
-            with open(f"{filename}", "x") as backup:
-                read_ip_prefix(self, backup)
-                read_block(self, "DEQU", 1, "STDT", backup)
-                read_block(self, "DRES", 1, "STDT", backup)
-                read_block(self, "DRCI", 2, "STDT", backup)
-                read_block(self, "DRCS", 2, "STDT", backup)
-                read_block(self, "DMNT", 2, "STDT", backup)
-                read_block(self, "YAX1", 4, "STDT", backup)
-                read_block(self, "YAX1", 1, "SPRM", backup)
-                read_block(self, "ZAX1", 4, "STDT", backup)
-                read_block(self, "ZAX1", 1, "SPRM", backup)
-                read_block(self, "DSTG", 1, "STDT", backup)
-                read_block(self, "DMPR", 1, "STDT", backup)
-                read_block(self, "DPRM", 64, "STDT", backup)
-                read_block(self, "DCST", 1, "STDT", backup)
-                read_block(self, "DE84", 1, "STDT", backup)
-        
-        def read_data_prealigner(self, filename):
-            with open(f"{filename}", "x") as backup:
-                if self.identifier == "RA320_002":
-                    read_block(self,"DRES", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DEQU", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DRCS", 4, "STDT", backup, add_leading=True)
-                    read_block(self,"DMNT", 4, "STDT", backup, add_leading=True)
-                    for i in range(5):
-                        read_block(self, "DSDB", 3, f"STDT[{i:03}]", backup, add_leading=True)
-                    read_block(self, "DTMP", 1, "STDT", backup, add_leading=True)
-                    read_block(self, "DALN", 10, "STDT", backup, add_leading=True)
-                    read_block(self, "DROT", 100, "STDT", backup, add_leading=True)
-                    read_block(self, "DPRS", 1, "STDT", backup, add_leading=True)
-                    read_block(self, "DSEN", 10, "STDT", backup, add_leading=True)
-                    read_block(self, "DRCP", 10, "STDT", backup, add_leading=True)
-
-                elif self.identifier == "RA320_003":
-                    read_block(self,"DRES", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DEQU", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DRCS", 4, "STDT", backup, add_leading=True)
-                    read_block(self,"DMNT", 4, "STDT", backup, add_leading=True)
-                    for i in range(5):
-                        read_block(self, "DSDB", 3, f"STDT[{i:03}]", backup, add_leading=True)
-                    read_block(self, "DTMP", 1, "STDT", backup, add_leading=True)
-                    read_block(self, "DCAM", 4, "STDT", backup, add_leading=True)
-                    read_block(self, "DALN", 10, "STDT", backup, add_leading=True)
-                    read_block(self, "DROT", 100, "STDT", backup, add_leading=True)
-                    read_block(self, "DSEN", 10, "STDT", backup, add_leading=True)
-                    read_block(self, "DRCP", 10, "STDT", backup, add_leading=True)
-
-                elif self.identifier == "RA420_001":
-                    read_block(self,"DEQU", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DRCS", 4, "STDT", backup, add_leading=True)
-                    read_block(self,"DSAX", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DSAY", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DSAZ", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DSAR", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DMNT", 4, "STDT", backup, add_leading=True)
-                    read_block(self,"DRES", 1, "STDT", backup, add_leading=True)
-                    for i in range(5):
-                        read_block(self,"DSDB", 3, f"STDT[{i:03}]", backup, add_leading=True)
-                    read_block(self,"DTMP", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DCAM", 4, "STDT", backup, add_leading=True)
-                    read_block(self,"DAWS", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DALN", 8, "STDT", backup, add_leading=True)
-                    read_block(self,"DROT", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DPRS", 1, "STDT", backup, add_leading=True)
-                    read_block(self,"DSEN", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DRCP", 10, "STDT", backup, add_leading=True)
-                    read_block(self,"DITK", 64, "STDT", backup, add_leading=True)
-                    read_block(self,"DOUT", 64, "STDT", backup, add_leading=True)
-
-        def read_data_robot(self, filename):
-            """
-            Robot backup depends whether the robot has a linear track,
-            and also on its arm configuration, so these parameters need to be saved
-            """
-            # If no x-axis, the XAX1 parameter becomes shorter
-            xaxis = int(self.send_and_read(f"{self.read_name()}.DEQU.GTDT[18]").split(':')[1])
-            logger.debug(f"XAXIS: {xaxis}")
-            if xaxis == 0:
-                XAX1_list = [0,1,2,3]
-            else:
-                XAX1_list = [0,1,2,3,8,9,10,11,12,13,14,15,16,17,18,19,40]
-
-            arm_config = self.send_and_read(f"{self.read_name()}.DEQU.GTDT[16]")
-            logger.debug(f"arm_config: {arm_config}, Type: {type(arm_config)}")
-            arm_config = int(arm_config.split(":")[1])
-            logger.debug(f"arm_config after changes: {arm_config}")
-            arm1 = hex(arm_config)[-4:-2]
-            arm2 = hex(arm_config)[-6:-4]
-            logger.debug(f"arm config: {arm1}, {arm2}")
-
-            with open(f"{filename}", "x") as backup:
-                read_ip_prefix(self, backup)
-                read_block(self,"DEQU", 1, "STDT", backup)
-                read_block(self,"DRES", 1, "STDT", backup)
-                read_block(self,"DRCI", 5, "STDT", backup)
-                read_block(self,"DRCS", 5, "STDT", backup)
-                read_block(self,"DRCH", 5, "STDT", backup)
-                read_block(self,"DMNT", 5, "STDT", backup)
-                read_block(self,"XAX1", XAX1_list, "STDT", backup)
-                read_block(self,"XAX1", 1, "SPRM", backup)
-                read_block(self,"ZAX1", 4, "STDT", backup)
-                read_block(self,"ZAX1", 1, "SPRM", backup)
-                read_block(self,"ROT1", 4, "STDT", backup)
-                read_block(self,"ROT1", 1, "SPRM", backup)
-                read_block(self,"ARM1", 4, "STDT", backup)
-                read_block(self,"ARM1", 1, "SPRM", backup)
-                read_block(self,"ARM2", 4, "STDT", backup)
-                read_block(self,"ARM2", 1, "SPRM", backup)
-                read_block(self,"XAX1", 16, "SEPM", backup)
-                read_block(self,"ZAX1", 16, "SEPM", backup)
-                read_block(self,"ROT1", 16, "SEPM", backup)
-                read_block(self,"ARM1", 16, "SEPM", backup)
-                read_block(self,"ARM2", 16, "SEPM", backup)
-                read_block(self,"DAPM", 3, "STDT", backup)
-                read_block(self,"DITK", 32, "STDT", backup)
-                read_block(self,"DOUT", 32, "STDT", backup)
-                read_block(self,"DTRB", 400, "STDA", backup)
-                read_block(self,"DTUL", 400, "STDA", backup)
-                read_block(self,"DMPR", 400, "STDT", backup)
-                read_block(self,"DCFG", 400, "STDT", backup)
-                for i in range(4):
-                    read_block(self, "DAXM", 400, f"STDT[{i}]", backup)
-                read_block(self,"DSSC", 32, "STDT", backup)
-                read_block(self,"DIND", 4, "STDT", backup)
-                # If Framed arm is present, read DALN
-                if any(arm == "25" for arm in [arm1, arm2]):
-                    read_block(self,"DALN", 32, "STDT", backup)
-
-        # Timestamp
-        ts = datetime.now().strftime("%Y%m%d")
-        index = 1
-        backup_dir = self.get_backup_dir()
-        filename_file = f"{self.identifier[:5]}_{self.sn}_{ts}_{index}{suffix}.dat"
-        filename = backup_dir / filename_file
-
-        # Make sure to not overwrite a previous backup
-        while os.path.exists(filename):
-            index+=1
-            filename_short = f"{self.identifier[:5]}_{self.sn}_{ts}_{index}{suffix}.dat"
-            filename = backup_dir / filename_short
-            logger.warning(f"File exists! Changing filename to {filename}")
+        store = self.backup_store()
+        name = self.backup_name(store, suffix)
+        stored = None
 
         #logger.debug(f"cwd = {os.getcwd()}")
-        logger.debug(f"writing backup to = {os.path.abspath(filename)}")
-
-        # Save log level and set to INFO to avoid hundreds of debug msgs
-        log_level = logging.getLogger(__name__).level
-        logging.getLogger(__name__).setLevel(logging.INFO)
-
-        try: 
-            if self.identifier in LOADPORTS:
-                logger.info(f"Starting Loadport Backup for {self.name}.")
-                read_data_loadport(self, filename)
-            elif self.identifier in ROBOTS:
-                logger.info(f"Starting Robot Backup for {self.name}")
-                read_data_robot(self, filename)
-            elif self.identifier in PREALIGNERS:
-                logger.info(f"Starting Prealigner Backup for {self.name}")
-                read_data_prealigner(self, filename)
-            elif self.identifier == "RTS13":
-                logger.info(f"Starting Linear Track Backup for {self.name}")
-                read_data_lineartrack(self, filename)
-            else:
-                error = f"Backup not implemented for component {self.identifier}"
-                logger.error(error)
-                raise Exception(error)
-            status = f"Backup saved to '{filename}'"
+        logger.debug(f"writing backup {name} to = {os.path.abspath(store.root)}")
+
+        try:
+            plan = self.backup_plan(await self.read_facts(timeout))
+
+            logger.info(f"Starting {self.identifier} Backup for {self.name} ({planner.plan_rows(plan)} rows)")
+            header = self.backup_header(suffix)
+            # Blocks already in the store are not written again, see block_store
+            with self.track("Backup", planner.plan_rows(plan)) as progress, \
+                 store.writer(name, header) as backup, \
+                 open(self.get_backup_dir() / f"{name}.dat", "x") as dat, \
+                 BackupWriter(self.get_backup_dir() / f"{name}{EXTENSION}", header) as container:
+                # Section, reply prefix and line start of every command, a section begins at its first row
+                rows = []
+                for prefix, block_rows in plan:
+                    section = section_name([line_start[:-1] for _, line_start in block_rows])
+                    rows += [(section if i == 0 else None, prefix, line_start) for i, (_, line_start) in enumerate(block_rows)]
+
+                def store_reply(i: int, reply: str) -> None:
+                    section, prefix, line_start = rows[i]
+                    if section is not None:
+                        backup.begin_section(section)
+                        container.begin_section(section)
+                        progress.start_block(section)
+                    line = self.backup_line(prefix, line_start, reply)
+                    backup.add_row(line_start[:-1], line)
+                    container.add_row(line_start[:-1], line)
+                    print(line, file=dat)
+
+                commands, prefixes = planner.plan_commands(plan)
+                if pipelined:
+                    # The whole plan is one pipelined stream
+                    await self.send_and_read_pipelined(commands, prefixes, store_reply, timeout)
+                else:
+                    for i, command in enumerate(commands):
+                        store_reply(i, await self.send_and_read(command, timeout))
+                # Waiting for the disk would stall every session on the event loop
+                await asyncio.to_thread(container.finish)
+                await asyncio.to_thread(backup.finish)
+            logger.info(progress.summary())
+
+            stored = name
+            status = f"Backup saved as '{name}'"
             self.status = status
             logger.info(status)
         except Exception as e:
             logger.error(f"Reading failed: {e}")
-            self.status = {f"Reading failed: {e}"}
+            self.status = f"Reading failed: {e}"
 
-        # restore log level
-        logging.getLogger(__name__).setLevel(log_level)
\ No newline at end of file
+        return stored
+
+class EventLoop:
+    """
+    The asyncio event loop of all Rorze sessions, running in one background thread.
+    It is started by the first session, run() may be called from any other thread.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def run(self, coroutine):
+        """Run a coroutine on the loop and wait for its result"""
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="rorze-sessions", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+EVENT_LOOP = EventLoop()
+
+class Rorze:
+    """
+    Synchronous session for the menus and worker threads, a thin wrapper around AsyncRorze:
+    Its coroutines run on EVENT_LOOP and block until they are done, all other attributes
+    are read and written on the AsyncRorze, e.g.
+        component = Rorze(comp_info)
+        component.set_host_port(12000)
+        component.status
+    """
+
+    def __init__(self, comp_info: dict, simulation:bool = False, sock: socket.socket | None = None):
+        object.__setattr__(self, "session", AsyncRorze(comp_info, simulation))
+        self.establish_connection(sock=sock)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.session, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def run(*args, **kwargs):
+            return EVENT_LOOP.run(attribute(*args, **kwargs))
+        return run
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self.session, name, value)
+
+    @contextmanager
+    def transaction(self):
+        """See AsyncRorze.transaction"""
+        context = self.session.transaction()
+        EVENT_LOOP.run(context.__aenter__())
+        try:
+            yield self
+        except BaseException as e:
+            if not EVENT_LOOP.run(context.__aexit__(type(e), e, e.__traceback__)):
+                raise
+        else:
+            EVENT_LOOP.run(context.__aexit__(None, None, None))
@@ -5,69 +5,313 @@ Contains utility classes and functions
 """
 
 import concurrent.futures
+import errno
+import ipaddress
 import logging
+import os
+import queue
+import selectors
 import socket
-import subprocess
+import struct
+import threading
+import time
+from typing import Iterator
+from comp_mgr.cache import COMPONENT_CACHE
 from comp_mgr.config import NETWORK, OTHER_IPS
+from comp_mgr.session_pool import SESSION_POOL
 
 logger = logging.getLogger(__name__)
 
+class ProbeEngine:
+    """
+    Finds alive hosts without subprocesses, on any OS.
+
+    Every IP gets a non-blocking TCP connect to the Rorze port. An accepted connection is a
+    component, a refused connection is a host without the Rorze service (e.g. a PC).
+    IPs that do not answer within the connect timeout are pinged right away, if the OS permits
+    ICMP sockets. Their connect is still unknown, not dead, and stays open until the deadline:
+    Windows retries a refused connect for about a second and only admins may ping.
+    At most max_concurrent connects are open at once and, if a rate is given, at most rate
+    connects are started per second, to not flood the equipment network.
+    """
+    PORT = 12100
+    MAX_CONCURRENT = 128
+    CONNECT_TIMEOUT = 0.5
+    DEADLINE = 1.5
+    # Sweeps over whole subnets
+    SWEEP_MAX_CONCURRENT = 256
+    SWEEP_RATE = 500
+
+    # Connect results, which mean that the host answered
+    ALIVE_ERRORS = (0, errno.ECONNREFUSED)
+    # Connect results of a connect that is still in progress
+    IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, getattr(errno, "WSAEWOULDBLOCK", -1))
+
+    def __init__(self, port: int = PORT, max_concurrent: int = MAX_CONCURRENT,
+                 connect_timeout: float = CONNECT_TIMEOUT, icmp_fallback: bool = True,
+                 rate: float | None = None, open_only: bool = False):
+        self.port = port
+        self.max_concurrent = max_concurrent
+        self.connect_timeout = connect_timeout
+        self.rate = rate
+        # Only hosts that accept the connection count, which rules out the ping as well
+        self.open_only = open_only
+        self.icmp_fallback = icmp_fallback and not open_only
+
+    def probe(self, ips: list[str], deadline: float | None = None) -> Iterator[str]:
+        """
+        Yield every alive IP as soon as it answers.
+        Without a deadline, the scan takes DEADLINE, or as long as the rate limit needs.
+        """
+        for ip, sock in self.probe_connections(ips, deadline):
+            if sock is not None:
+                sock.close()
+            yield ip
+
+    def probe_connections(self, ips: list[str], deadline: float | None = None) -> Iterator[tuple[str, socket.socket | None]]:
+        """
+        Like probe(), but yield (ip, sock) where sock is the connection to the Rorze port,
+        or None if the host refused it or only answered a ping. The caller owns the socket.
+        """
+        if deadline is None:
+            deadline = self.DEADLINE
+            if self.rate:
+                deadline = max(deadline, len(ips) / self.rate + self.connect_timeout)
+        alive_errors = (0,) if self.open_only else self.ALIVE_ERRORS
+        end = time.monotonic() + deadline
+        next_start = time.monotonic()
+        waiting = list(reversed(ips))
+        connecting = 0
+        pinged = set()
+        # Connects past the connect timeout, which no longer count against max_concurrent
+        overdue = {}
+        icmp = None
+        selector = selectors.DefaultSelector()
+        try:
+            while (waiting or connecting or pinged or overdue) and time.monotonic() < end:
+                # Start new connects up to the concurrency and rate limit
+                while waiting and connecting < self.max_concurrent:
+                    if self.rate:
+                        now = time.monotonic()
+                        if now < next_start:
+                            break
+                        # Don't save up starts while the concurrency limit was reached
+                        next_start = max(next_start, now - 1 / self.rate) + 1 / self.rate
+                    ip = waiting.pop()
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    result = sock.connect_ex((ip, self.port))
+                    if result in self.IN_PROGRESS:
+                        selector.register(sock, selectors.EVENT_WRITE, (ip, time.monotonic()))
+                        connecting += 1
+                        continue
+                    if result == 0:
+                        yield ip, sock
+                        continue
+                    sock.close()
+                    if result in alive_errors:
+                        yield ip, None
+
+                now = time.monotonic()
+                timeouts = [key.data[1] + self.connect_timeout
+                            for key in selector.get_map().values()
+                            if key.data is not None and key.data[0] not in overdue]
+                if waiting and self.rate and connecting < self.max_concurrent:
+                    timeouts.append(next_start)
+                timeout = min([end] + timeouts) - now
+                if not selector.get_map():
+                    # Nothing to select on (on Windows, select() without sockets fails):
+                    # Done, unless the rate limit holds back the next connects
+                    if not waiting:
+                        break
+                    time.sleep(max(timeout, 0))
+                    continue
+                for key, _ in selector.select(max(timeout, 0)):
+                    if key.data is None:
+                        ip = self.read_echo_reply(icmp)
+                        if ip in pinged:
+                            pinged.discard(ip)
+                            # The pending connect is not needed anymore
+                            sock = overdue.pop(ip, None)
+                            if sock is not None:
+                                selector.unregister(sock)
+                                sock.close()
+                            yield ip, None
+                        continue
+                    ip, _ = key.data
+                    selector.unregister(key.fileobj)
+                    if overdue.pop(ip, None) is None:
+                        connecting -= 1
+                    result = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if result == 0:
+                        pinged.discard(ip)
+                        yield ip, key.fileobj
+                        continue
+                    key.fileobj.close()
+                    if result in alive_errors:
+                        pinged.discard(ip)
+                        yield ip, None
+                    else:
+                        logger.debug(f"ProbeEngine.probe() -> {ip}: {os.strerror(result)}")
+
+                # Connects that take too long are pinged, but kept open until the deadline.
+                # A sweep only counts accepted connects and gives them up to free the slot.
+                now = time.monotonic()
+                for key in list(selector.get_map().values()):
+                    if key.data is None or key.data[0] in overdue or now - key.data[1] <= self.connect_timeout:
+                        continue
+                    ip = key.data[0]
+                    connecting -= 1
+                    if self.open_only:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        continue
+                    overdue[ip] = key.fileobj
+                    if not self.icmp_fallback:
+                        continue
+                    if icmp is None:
+                        icmp = self.open_icmp_socket()
+                        if icmp is None:
+                            self.icmp_fallback = False
+                            continue
+                        selector.register(icmp, selectors.EVENT_READ, None)
+                    if self.send_echo_request(icmp, ip):
+                        pinged.add(ip)
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+    def send_echo_request(self, sock: socket.socket, ip: str) -> bool:
+        # Echo request: type 8, code 0, checksum, identifier, sequence
+        header = struct.pack("!BBHHH", 8, 0, 0, os.getpid() & 0xFFFF, 1)
+        packet = struct.pack("!BBHHH", 8, 0, self.checksum(header), os.getpid() & 0xFFFF, 1)
+        try:
+            sock.sendto(packet, (ip, 0))
+            return True
+        except OSError as e:
+            logger.debug(f"ProbeEngine.send_echo_request() -> {ip}: {e}")
+            return False
+
+    def read_echo_reply(self, sock: socket.socket) -> str | None:
+        """Return the IP of an echo reply, or None for any other packet"""
+        try:
+            data, (ip, _) = sock.recvfrom(1024)
+        except OSError:
+            return None
+        # Raw sockets receive the IP header as well
+        if sock.type == socket.SOCK_RAW:
+            data = data[(data[0] & 0x0F) * 4:]
+        if data and data[0] == 0:
+            return ip
+        return None
+
+    def open_icmp_socket(self) -> socket.socket | None:
+        """Unprivileged ICMP sockets (Linux, macOS) or raw sockets (admin), if permitted"""
+        for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+                sock.setblocking(False)
+                return sock
+            except OSError:
+                continue
+        logger.debug("ProbeEngine.open_icmp_socket() -> ICMP not permitted, no fallback")
+        return None
+
+    def checksum(self, data: bytes) -> int:
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+
 class CompIF:
     TIMEOUT = 1
+    # Components identified at the same time during discovery
+    IDENTIFY_WORKERS = 16
+    # Hosts per sweep, a /16 takes about two minutes at the sweep rate
+    SWEEP_MAX_HOSTS = 2**16
 
     def __init__(self):
         self.status = "OK"
         self.system = "UNCONF"
+        self.probe_engine = ProbeEngine()
 
-    # Ping function for windows (doesnt work on linux)
-    def ping(self,ip):
-        command = ["ping", "-n", "1", "-w", "1000", ip]  # 500ms timeout
-        result = subprocess.run(command, stdout=subprocess.DEVNULL)
-        return ip if result.returncode == 0 else None
+    def known_ips(self) -> list[str]:
+        ips = [ip for system in NETWORK.values() for ip in system.values()]
+        ips+=list(OTHER_IPS.keys())
+        return ips
 
     # Discover all alive ips in the relevant sub nets
     def discover(self):
-        """Ping all known component IPs and find every component that is connected"""
+        """Probe all known component IPs and find every component that is connected"""
 
-        ips = [ip for system in NETWORK.values() for ip in system.values()]
-        ips+=list(OTHER_IPS.keys())
+        ips = self.known_ips()
+        alive = list(self.probe_engine.probe(ips))
+        # Keep the order of the known IPs
+        alive.sort(key=ips.index)
+        COMPONENT_CACHE.set_discovered(alive)
+        self.choose_system(alive)
+        return alive
 
+    def discover_components(self) -> Iterator[dict]:
+        """
+        Discovery and identification in one pass: The probe connection to the Rorze port is
+        taken over by the session, which identifies the component right away.
+        Yields the comp_info of every alive IP as soon as it is identified.
+        """
+        ips = self.known_ips()
         alive = []
+        results = queue.Queue()
 
-        n_workers = len(ips)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
-            results = executor.map(self.ping, ips)
-            for result in results:
-                if result:
-                    alive.append(result)
+        def probe() -> None:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.IDENTIFY_WORKERS) as executor:
+                for ip, sock in self.probe_engine.probe_connections(ips):
+                    alive.append(ip)
+                    future = executor.submit(self.get_component_info, ip, sock=sock)
+                    future.add_done_callback(results.put)
+            # All identifications are done, when the executor is shut down
+            results.put(None)
 
-        # Choose system preset
-        if any(ip.startswith('192.168.0.') for ip in alive):
-            self.system = "SEMDEX" 
-        elif any(ip.startswith('192.168.30.') for ip in alive):
-            if self.system == "SEMDEX":
-                raise Exception("Both SemDex and WMC configurations found!")
-            self.system = "WMC"
-
-        return alive
+        threading.Thread(target=probe, daemon=True).start()
+        while (future := results.get()) is not None:
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(f"CompIF.discover_components() -> Identification failed: {e}")
 
-    def send_and_read_rorze(self, sock: socket.socket, command: str, buffer: int=1024) -> str:
+        alive.sort(key=ips.index)
+        # Remember the alive IPs even if the system cannot be chosen
+        COMPONENT_CACHE.set_discovered(alive)
+        self.choose_system(alive)
 
-        # Add a \r at the end of a command!
-        command = f"{command}\r"
+    def choose_system(self, alive: list[str]) -> None:
+        # Choose system preset
+        semdex = any(ip.startswith('192.168.0.') for ip in alive)
+        wmc = any(ip.startswith('192.168.30.') for ip in alive)
+        if semdex and wmc:
+            raise Exception("Both SemDex and WMC configurations found!")
+        elif semdex:
+            self.system = "SEMDEX"
+        elif wmc:
+            self.system = "WMC"
 
-        logger.debug(f"Sending: {command}")
-        sock.sendall(command.encode('utf-8')) 
-        try: 
-            read = sock.recv(buffer)
-            logger.debug(f"Receive: {read}")
-            message = str(read)[2:-3].split(':')[1]
-        except socket.timeout:
-            logger.error("Timeout")
-        except socket.error as e:
-            logger.error(f"Socket error: {e}")
+    def sweep(self, cidrs: list[str]) -> Iterator[str]:
+        """
+        Sweep whole subnets (e.g. '172.20.9.0/24') for components at unexpected addresses.
+        Only hosts with an open Rorze port are yielded, as soon as they are found.
+        """
+        networks = [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in cidrs]
+        # Check the size before the hosts are listed, a /8 (or any IPv6 subnet) would not fit in memory
+        if sum(network.num_addresses for network in networks) > self.SWEEP_MAX_HOSTS:
+            raise ValueError(f"{', '.join(cidrs)} is too large, at most {self.SWEEP_MAX_HOSTS} addresses (/16) can be swept")
+        ips = list(dict.fromkeys(str(ip) for network in networks for ip in network.hosts()))
 
-        return message
+        logger.info(f"Sweeping {len(ips)} IPs in {', '.join(cidrs)}...")
+        engine = ProbeEngine(max_concurrent=ProbeEngine.SWEEP_MAX_CONCURRENT,
+                             rate=ProbeEngine.SWEEP_RATE, open_only=True)
+        for ip in engine.probe(ips):
+            logger.info(f"Sweep found {ip}")
+            yield ip
 
     def get_ip_info(self, target_ip: str) -> str:
         """Check whether the IP corresponds to an actual component"""
@@ -84,11 +328,12 @@ class CompIF:
                 logger.debug(f"CompIF.get_ip_info() -> IP info: {ip_info}")
                 return ip_info
         
-        ip_info = {"IP": ip, "System": None, "Type": "Unknown IP"}
+        ip_info = {"IP": target_ip, "System": None, "Type": "Unknown IP"}
         logger.debug(f"CompIF.get_ip_info() -> IP info: {ip_info}")
         return ip_info
 
-    def get_component_info(self, ip: str, port:int=12100) -> dict:
+    def get_component_info(self, ip: str, connect_unknown: bool = False,
+                           sock: socket.socket | None = None) -> dict:
         """
         Creates the comp_info dictionary. This is unified for all components, regardless of manufacturer:
         {'IP':         192.168.0.1,
@@ -99,11 +344,15 @@ class CompIF:
          'Identifier': RR757
          'Firmware':   1.19U
         }
+        A connected socket to the Rorze port (e.g. from the discovery probe) is used, if given.
         """
         # Check, whether the ip corresponds to an actual component
+        # Unknown IPs are only connected to, if a Rorze port was found there (e.g. by a sweep)
         comp_info = self.get_ip_info(ip)
 
-        if comp_info["Type"] == "Unknown IP":
+        if comp_info["Type"] == "Unknown IP" and not connect_unknown:
+            if sock is not None:
+                sock.close()
             comp_info["Name"] = None
             comp_info["SN"] = None
             comp_info["Identifier"] = None
@@ -111,53 +360,13 @@ class CompIF:
             logger.debug(f"Received component info: {comp_info}")
             return comp_info
 
-        # If its a component, find out which type
+        # If its a component, find out which type (the session stays open for later use)
         logger.info(f"Connecting to {ip}...")
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(self.TIMEOUT)
-
-        try:
-            sock.connect((ip, port))
-            read = str(sock.recv(1024))
-            logger.debug(f"Comp_IF.get_component_info -> Received: {read}")
-            message = read[2:-3] # Cuts the b' and \\r
-
-            # If Rorze component, return name and serial number
-            if any(p in read for p in ['TRB','ALN','STG','TBL']):
-                name = message.split('.')[0][1:]
-                # Get Rorze Serial Number
-                sn_command = f"o{name}.DEQU.GTDT[0]"
-                serial_number = self.send_and_read_rorze(sock,sn_command)
-                # Get Rorze Component Type and Firmware version
-                # Example str: aTRB0.GVER:RORZE STD_TRB RR754 Ver 1.19U (2020/12/17)
-                verstring = self.send_and_read_rorze(sock, f"o{name}.GVER")
-                identifier = verstring.split(" Ver ")[0].split(" ")[-1]
-                firmware = verstring.split(" Ver ")[1][:5]
-                comp_info["Name"] = name
-                comp_info["SN"] = serial_number.split('"')[1]
-                comp_info["Identifier"] = identifier
-                comp_info["Firmware"] = firmware
-                logger.info(f"{ip} - Component type detected: Rorze {identifier}")
-                logger.debug(f"Received component info: {comp_info}")
-
-                # If prealigner, set the status events to off (done by maintenance software)
-                self.send_and_read_rorze(sock, f"o{name}.EVNT(0,0)")
-                sock.close()
-                return comp_info
-
-            else:
-                comp_info["Name"] = None
-                comp_info["SN"] = None
-                comp_info["Identifier"] = None
-                comp_info["Firmware"] = None
-                logger.debug(f"Received component info: {comp_info}")
-                sock.close()
-                return comp_info
-
-        except socket.timeout:
-            logger.debug(f"Comp_IF.get_component_info() -> Connection Timeout when connecting to {ip}.")
-        except socket.error as e:
-            logger.debug(f"Comp_IF.get_component_info -> Connection attempt to unsuccessful: {e}")
+        session = SESSION_POOL.get_session(comp_info, sock=sock)
+        if session:
+            comp_info.update(session.identity())
+            logger.debug(f"Received component info: {comp_info}")
+            return comp_info
 
         # If no connection can be established, return empty info
         comp_info["Name"] = None
@@ -165,4 +374,4 @@ class CompIF:
         comp_info["Identifier"] = None
         comp_info["Firmware"] = None
         logger.debug(f"Received component info: {comp_info}")
-        return comp_info
\ No newline at end of file
+        return comp_info
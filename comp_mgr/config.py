@@ -112,7 +112,11 @@ COMPONENT_MENU_OPTIONS = {
         {'label': 'Get Status', 'type': 'command', 'action': 'get_status'},
         {'label': 'Change IP', 'type': 'value', 'action': 'change_IP', 'action_factory': 'change_IP_popup'},
         {'label': 'Set Log Host IP', 'type': 'value', 'action': 'set_log_host', 'action_factory': 'change_log_host_popup'},
-        {'label': 'Create backup (Read Data)', 'type': 'command', 'action': 'read_data'}
+        {'label': 'Create backup (Read Data)', 'type': 'command', 'action': 'read_data'},
+        {'label': 'Restore from backup', 'type': 'selection', 'action': 'restore_backup', 'action_factory': 'restore_popup'},
+        {'label': 'Export backup (.dat)', 'type': 'selection', 'action': 'export_backup', 'action_factory': 'export_popup'},
+        {'label': 'Compare backups', 'type': 'selection', 'action': 'compare_backups', 'action_factory': 'compare_popup'},
+        {'label': 'Communication metrics', 'type': 'selection', 'action': 'show_metrics', 'action_factory': 'metrics_popup'}
     ],
     'RR754': [
         {'label': 'Read External Sensors (GAIO)', 'type': 'command', 'action': 'GAIO'},
@@ -128,5 +132,131 @@ COMPONENT_MENU_OPTIONS = {
     ]
 }
 
+# Backup layout per identifier, in the order of the backup file ('Read Data' of the Rorze maintenance software).
+# Every entry reads one block, see planner.compile_plan:
+#   'block':   block name, None for the component itself (e.g. the IP row STDT[1])
+#   'command': set command written to the backup file, the get command is derived from it (STDT -> GTDT)
+#   'rows':    number of rows or list of row indices. A single row is read without index
+#   'leading': write indices with leading zeros, e.g. [003]
+#   'repeat':  read the entry n times, '{i}' in the command is replaced by 0..n-1
+#   'when':    only read the entry if the condition holds, see planner.CONDITIONS
+BACKUP_SCHEMAS = {
+    'RTS13': [
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1},
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1},
+        # Lineartrack needs extra [0]
+        {'block': 'DRCI', 'command': 'STDT[0]', 'rows': 1},
+        {'block': 'DRCS', 'command': 'STDT[0]', 'rows': 1},
+        {'block': 'DRCH', 'command': 'STDT[0]', 'rows': 1},
+        {'block': 'DMNT', 'command': 'STDT[0]', 'rows': 1},
+        {'block': 'XAX1', 'command': 'STDT', 'rows': [0,1,2,8,9,10,11,12,13,14,15,16,17,18,19,40]},
+        {'block': 'XAX1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'XAX1', 'command': 'SEPM', 'rows': 16},
+        {'block': 'DTBL', 'command': 'STDA', 'rows': 400},
+    ],
+    'RV201-F07-000': [
+        {'block': None, 'command': 'STDT[1]', 'rows': 1},
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1},
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1},
+        {'block': 'DRCI', 'command': 'STDT', 'rows': 2},
+        {'block': 'DRCS', 'command': 'STDT', 'rows': 2},
+        {'block': 'DMNT', 'command': 'STDT', 'rows': 2},
+        {'block': 'YAX1', 'command': 'STDT', 'rows': 4},
+        {'block': 'YAX1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'ZAX1', 'command': 'STDT', 'rows': 4},
+        {'block': 'ZAX1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'DSTG', 'command': 'STDT', 'rows': 1},
+        {'block': 'DMPR', 'command': 'STDT', 'rows': 1},
+        {'block': 'DPRM', 'command': 'STDT', 'rows': 64},
+        {'block': 'DCST', 'command': 'STDT', 'rows': 1},
+        {'block': 'DE84', 'command': 'STDT', 'rows': 1},
+    ],
+    'RA320_002': [
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DRCS', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DMNT', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DSDB', 'command': 'STDT[{i:03}]', 'rows': 3, 'leading': True, 'repeat': 5},
+        {'block': 'DTMP', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DALN', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DROT', 'command': 'STDT', 'rows': 100, 'leading': True},
+        {'block': 'DPRS', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DSEN', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DRCP', 'command': 'STDT', 'rows': 10, 'leading': True},
+    ],
+    'RA320_003': [
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DRCS', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DMNT', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DSDB', 'command': 'STDT[{i:03}]', 'rows': 3, 'leading': True, 'repeat': 5},
+        {'block': 'DTMP', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DCAM', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DALN', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DROT', 'command': 'STDT', 'rows': 100, 'leading': True},
+        {'block': 'DSEN', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DRCP', 'command': 'STDT', 'rows': 10, 'leading': True},
+    ],
+    'RA420_001': [
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DRCS', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DSAX', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DSAY', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DSAZ', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DSAR', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DMNT', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DSDB', 'command': 'STDT[{i:03}]', 'rows': 3, 'leading': True, 'repeat': 5},
+        {'block': 'DTMP', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DCAM', 'command': 'STDT', 'rows': 4, 'leading': True},
+        {'block': 'DAWS', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DALN', 'command': 'STDT', 'rows': 8, 'leading': True},
+        {'block': 'DROT', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DPRS', 'command': 'STDT', 'rows': 1, 'leading': True},
+        {'block': 'DSEN', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DRCP', 'command': 'STDT', 'rows': 10, 'leading': True},
+        {'block': 'DITK', 'command': 'STDT', 'rows': 64, 'leading': True},
+        {'block': 'DOUT', 'command': 'STDT', 'rows': 64, 'leading': True},
+    ],
+    'RR754': [
+        {'block': None, 'command': 'STDT[1]', 'rows': 1},
+        {'block': 'DEQU', 'command': 'STDT', 'rows': 1},
+        {'block': 'DRES', 'command': 'STDT', 'rows': 1},
+        {'block': 'DRCI', 'command': 'STDT', 'rows': 5},
+        {'block': 'DRCS', 'command': 'STDT', 'rows': 5},
+        {'block': 'DRCH', 'command': 'STDT', 'rows': 5},
+        {'block': 'DMNT', 'command': 'STDT', 'rows': 5},
+        # Without x-axis, the XAX1 parameter is shorter
+        {'block': 'XAX1', 'command': 'STDT', 'rows': [0,1,2,3], 'when': 'no_linear_track'},
+        {'block': 'XAX1', 'command': 'STDT', 'rows': [0,1,2,3,8,9,10,11,12,13,14,15,16,17,18,19,40], 'when': 'linear_track'},
+        {'block': 'XAX1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'ZAX1', 'command': 'STDT', 'rows': 4},
+        {'block': 'ZAX1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'ROT1', 'command': 'STDT', 'rows': 4},
+        {'block': 'ROT1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'ARM1', 'command': 'STDT', 'rows': 4},
+        {'block': 'ARM1', 'command': 'SPRM', 'rows': 1},
+        {'block': 'ARM2', 'command': 'STDT', 'rows': 4},
+        {'block': 'ARM2', 'command': 'SPRM', 'rows': 1},
+        {'block': 'XAX1', 'command': 'SEPM', 'rows': 16},
+        {'block': 'ZAX1', 'command': 'SEPM', 'rows': 16},
+        {'block': 'ROT1', 'command': 'SEPM', 'rows': 16},
+        {'block': 'ARM1', 'command': 'SEPM', 'rows': 16},
+        {'block': 'ARM2', 'command': 'SEPM', 'rows': 16},
+        {'block': 'DAPM', 'command': 'STDT', 'rows': 3},
+        {'block': 'DITK', 'command': 'STDT', 'rows': 32},
+        {'block': 'DOUT', 'command': 'STDT', 'rows': 32},
+        {'block': 'DTRB', 'command': 'STDA', 'rows': 400},
+        {'block': 'DTUL', 'command': 'STDA', 'rows': 400},
+        {'block': 'DMPR', 'command': 'STDT', 'rows': 400},
+        {'block': 'DCFG', 'command': 'STDT', 'rows': 400},
+        {'block': 'DAXM', 'command': 'STDT[{i}]', 'rows': 400, 'repeat': 4},
+        {'block': 'DSSC', 'command': 'STDT', 'rows': 32},
+        {'block': 'DIND', 'command': 'STDT', 'rows': 4},
+        # Only robots with a framed arm have DALN
+        {'block': 'DALN', 'command': 'STDT', 'rows': 32, 'when': 'framed_arm'},
+    ],
+}
+
 class MESSAGES:
     SUCCESS = "Program ran successfully"
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Desired state
+
+Turns the Config_List of a component into the parameter values it should end up with.
+The current values are read in one batch and only real differences are written, such that
+an already configured component is neither rewritten nor written to flash again.
+The setters of AsyncRorze build their targets here as well. Items that depend on the current
+values of the component are coroutines, a DesiredState is always built on an AsyncRorze.
+"""
+import logging
+from comp_mgr.config import PREALIGNERS
+
+logger = logging.getLogger(__name__)
+
+class DesiredState:
+    """
+    Target (parameter, value) set of one AsyncRorze session.
+    Later targets for the same parameter replace earlier ones, like the writes they replace.
+    """
+    # Aligner speed: (acceleration, speed) of the slow mode and of the normal mode
+    SLOW_ALIGNER = (100000, 30000)
+    NORMAL_ALIGNER = (450000, 120000)
+
+    def __init__(self, component):
+        self.component = component
+        self.targets = {}
+        # Descriptions of the configured items, for reporting
+        self.items = []
+
+    def add(self, parameters: list[tuple[str, object]] | None, description: str | None = None) -> "DesiredState":
+        if parameters is None:
+            self.component.not_implemented()
+            return self
+        for parameter, value in parameters:
+            self.targets[parameter] = value
+        if description:
+            self.items.append(description)
+        return self
+
+    def parameters(self) -> list[tuple[str, object]]:
+        return list(self.targets.items())
+
+    # ========== Config items ==========
+
+    def basic_settings(self) -> "DesiredState":
+        component = self.component
+        host_ip, port, log_host = component.basic_settings_values()
+        if component.identifier in PREALIGNERS:
+            self.add(component.host_interface_parameters())
+            self.body_no(1, description=None)
+        self.add(component.loadport_parameters())
+        self.add(component.host_IP_parameters(host_ip))
+        self.add(component.host_port_parameters(port))
+        self.add(component.log_host_parameters(log_host))
+        self.items.append("Basic settings")
+        return self
+
+    def body_no(self, body_no: int, description: str | None = "Body number") -> "DesiredState":
+        """Body number, and the IP that belongs to it"""
+        component = self.component
+        self.add(component.body_no_parameters(body_no), description)
+        ip = component.body_no_IP(body_no)
+        if ip:
+            self.add(component.ip_parameters(ip))
+        return self
+
+    async def flip_near(self, setting: str) -> "DesiredState":
+        """The software switch is a bit field, the target depends on the current value"""
+        parameter = "DEQU.STDT[8]"
+        current = (await self.component.read_parameters([(parameter, None)]))[0]
+        if current is None:
+            logger.warning("Software switch unknown, flip near is not set")
+            return self
+        software_switch = self.component.flip_near_value(int(current), setting)
+        return self.add([(parameter, software_switch)], f"Flip near {setting}")
+
+    async def aligner_speed(self, speed: str) -> "DesiredState":
+        component = self.component
+        if speed == "Slow":
+            return self.add(component.aligner_speed_parameters(*self.SLOW_ALIGNER), "Slow mode")
+
+        # Leave as is, unless the speed has been set to slow before!
+        parameters = component.aligner_speed_parameters(*self.SLOW_ALIGNER)[:2]
+        current = await component.read_parameters(parameters)
+        if component.changed_parameters(parameters, current):
+            return self
+        logger.warning("Detected slow aligner setting. Restoring speed parameter.")
+        return self.add(component.aligner_speed_parameters(*self.NORMAL_ALIGNER), "Normal speed")
+
+    async def from_config(self, config_list: dict) -> "DesiredState":
+        """Add the targets of every config item of the autosetup"""
+        component = self.component
+        for config_item, config in config_list.items():
+            # If slow mode is NOT chosen -> check if speed needs to be restored to normal
+            if not config['enabled']:
+                if config_item == "Slow_Mode":
+                    await self.aligner_speed("Normal")
+                continue
+
+            if config_item == "Target_IP":
+                if component.ip != config["value"]:
+                    self.add(component.ip_parameters(config["value"]), f"IP {config['value']}")
+            elif config_item == "Notch_Angle":
+                self.add(component.notch_angle_parameters(config["value"]), f"Notch angle {config['value']}")
+            elif config_item == "Basic_Settings":
+                self.basic_settings()
+            elif config_item == "Spindle_Fix":
+                self.add(component.spindle_fix_parameters(), "Spindle fix")
+            elif config_item == "No_Interpolation":
+                self.add(component.no_interpolation_parameters(), "No interpolation")
+            elif config_item == "Flip_Near":
+                await self.flip_near("On")
+            elif config_item == "Set_Body_Number":
+                self.body_no(config["value"])
+            elif config_item == "Slow_Mode":
+                await self.aligner_speed("Slow")
+        return self
+
+    async def apply(self, write=1) -> list[tuple[str, object]]:
+        """Write the parameters that differ, and write to flash only if any did"""
+        return await self.component.apply_parameters(self.parameters(), write)
@@ -25,3 +25,7 @@ class TestException(AutosetupMenuError):
 class Unhandled(Exception):
     """Raise when no Exception has been defined yet"""
     pass
+
+class CorruptBackup(Exception):
+    """Raise when a backup container is incomplete or does not match its checksums"""
+    pass
@@ -0,0 +1,133 @@
+"""
+Log module
+
+Logging pipeline of the program. Log calls only put the record on a queue, a background thread
+formats and writes it to logs/component_manager.log, which is rotated by size and by age.
+
+Frames on the wire are not logged one by one. The last FRAME_RING frames of all components are
+kept in memory (FRAMES), and are only written to logs/frames/ when an error is logged.
+"""
+import atexit
+import logging
+import os
+import queue
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+logger = logging.getLogger(__name__)
+
+LOG_DIR = "logs"
+LOG_FILE = "component_manager.log"
+FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+DATEFMT = "%Y-%m-%d %H:%M:%S"
+# Rotation: a new file after MAX_BYTES or ROTATE_INTERVAL seconds, BACKUP_COUNT old files are kept
+MAX_BYTES = 10 * 2**20
+ROTATE_INTERVAL = 24 * 3600
+BACKUP_COUNT = 10
+# Frames kept in memory
+FRAME_RING = 4096
+
+class FrameRing:
+    """
+    The last frames sent to and received from all components, as (time, ip, direction, frame).
+    Appending to the deque is thread-safe and does not format anything.
+    """
+
+    def __init__(self, size: int = FRAME_RING):
+        self.frames = deque(maxlen=size)
+        # Time of the newest frame of the last dump, frames are only dumped once
+        self.dumped = 0.0
+
+    def sent(self, ip: str, frame: str) -> None:
+        self.frames.append((time.time(), ip, ">", frame))
+
+    def received(self, ip: str, frame: str) -> None:
+        self.frames.append((time.time(), ip, "<", frame))
+
+    def dump(self, path: str) -> int:
+        """Write the frames since the last dump to path, returns the number of frames written"""
+        frames = [frame for frame in list(self.frames) if frame[0] > self.dumped]
+        if not frames:
+            return 0
+        self.dumped = frames[-1][0]
+        with open(path, "w", encoding="utf-8") as file:
+            for timestamp, ip, direction, frame in frames:
+                file.write(f"{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S.%f} {ip} {direction} {frame.rstrip()}\n")
+        return len(frames)
+
+FRAMES = FrameRing()
+
+class FrameDumpHandler(logging.Handler):
+    """Dumps the frame ring to a new file in directory, whenever an error is logged"""
+
+    def __init__(self, directory: str):
+        super().__init__(logging.ERROR)
+        self.directory = directory
+
+    def emit(self, record: logging.LogRecord) -> None:
+        path = os.path.join(self.directory, f"frames_{datetime.now():%Y%m%d_%H%M%S_%f}.log")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            count = FRAMES.dump(path)
+        except OSError:
+            self.handleError(record)
+            return
+        if count:
+            logger.info(f"Dumped the last {count} frames to {path}")
+
+class RotatingLogHandler(RotatingFileHandler):
+    """Rotates the file when it grows beyond max_bytes, or when it was started interval seconds ago"""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, interval: float):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        started = os.path.getmtime(filename) if os.path.getsize(filename) else time.time()
+        self.rollover_at = started + interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Puts the record on the queue as it is, it is formatted by the listener in the background.
+    Arguments of lazy calls such as logger.debug("%s", value) must not be changed afterwards.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def setup_logging(directory: str = LOG_DIR, level: int = logging.DEBUG) -> QueueListener:
+    """Route all logging through a queue to the rotating log file and the frame dump"""
+    os.makedirs(directory, exist_ok=True)
+    file_handler = RotatingLogHandler(os.path.join(directory, LOG_FILE), MAX_BYTES, BACKUP_COUNT, ROTATE_INTERVAL)
+    file_handler.setFormatter(logging.Formatter(FORMAT, DATEFMT))
+    dump_handler = FrameDumpHandler(os.path.join(directory, "frames"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    listener = QueueListener(log_queue, file_handler, dump_handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    listener.start()
+
+    def stop():
+        # Write everything that is queued, and log directly while the program shuts down
+        listener.stop()
+        root.removeHandler(queue_handler)
+        root.addHandler(file_handler)
+        while True:
+            try:
+                file_handler.handle(log_queue.get_nowait())
+            except queue.Empty:
+                break
+    atexit.register(stop)
+    return listener
@@ -0,0 +1,190 @@
+"""
+Metrics module
+
+Counters and latency histograms of the communication with every component, kept in fixed-size
+structures that are cheap enough to stay on in production. Each component is only updated by
+the thread (or task) holding its socket lock, exports only read them.
+
+Exported as JSON and Prometheus text on demand and when the program exits (logs/metrics.*).
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in seconds, the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+def command_family(command: str) -> str:
+    """'oTRB0.DTRB.GTDA[5]' -> 'GTDA', 'oTRB0.DEQU.STDT[1]=12' -> 'STDT', 'oTRB0.STAT' -> 'STAT'"""
+    head = command.split("=", 1)[0].rstrip("\r")
+    return head.rsplit(".", 1)[-1][:4]
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket that contains the quantile q"""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+class ComponentMetrics:
+    """Latency per command family (GTDT, STDT, WTDT, STAT, GAIO, ...), bytes and errors of one component"""
+
+    def __init__(self, ip: str, name: str | None = None):
+        self.ip = ip
+        self.name = name
+        self.latency = {}
+        self.commands = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.timeouts = 0
+        self.socket_errors = 0
+        # Reconnects of a dead session
+        self.retries = 0
+        # Events and other messages that did not answer a command
+        self.unexpected = 0
+
+    def observe(self, command: str, seconds: float, bytes_out: int, bytes_in: int) -> None:
+        """One answered command, its round-trip time and the bytes sent and received"""
+        family = command_family(command)
+        histogram = self.latency.get(family)
+        if histogram is None:
+            histogram = self.latency[family] = Histogram()
+        histogram.observe(seconds)
+        self.commands += 1
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+
+    def error(self, e: Exception) -> None:
+        if isinstance(e, TimeoutError):
+            self.timeouts += 1
+        else:
+            self.socket_errors += 1
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for family, histogram in sorted(self.latency.items()):
+            count = histogram.count()
+            latency[family] = {
+                "count": count,
+                "sum": histogram.sum,
+                "mean": histogram.sum / count if count else None,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+                "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram.counts)),
+            }
+        return {"ip": self.ip, "component": self.name, "commands": self.commands,
+                "bytes_out": self.bytes_out, "bytes_in": self.bytes_in, "timeouts": self.timeouts,
+                "socket_errors": self.socket_errors, "retries": self.retries,
+                "unexpected": self.unexpected, "latency": latency}
+
+    def summary_lines(self) -> list[str]:
+        """Lines for the TUI"""
+        snapshot = self.snapshot()
+        lines = [f"{self.name or ''} {self.ip}: {self.commands} commands, {self.bytes_out} bytes out, {self.bytes_in} bytes in",
+                 f"Timeouts: {self.timeouts}, socket errors: {self.socket_errors}, reconnects: {self.retries}, "
+                 f"unexpected messages: {self.unexpected}", "",
+                 f"{'Family':8}{'Count':>8}{'Mean ms':>10}{'p50 ms <=':>11}{'p99 ms <=':>11}"]
+        for family, stats in snapshot["latency"].items():
+            lines.append(f"{family:8}{stats['count']:>8}{stats['mean'] * 1000:>10.2f}"
+                         f"{stats['p50'] * 1000:>11g}{stats['p99'] * 1000:>11g}")
+        return lines
+
+class Metrics:
+    """All ComponentMetrics of the program, by IP"""
+    PATH = os.path.join("logs", "metrics")
+
+    def __init__(self):
+        self.components = {}
+        self.lock = threading.Lock()
+        self.start = time.time()
+
+    def component(self, ip: str, name: str | None = None) -> ComponentMetrics:
+        metrics = self.components.get(ip)
+        if metrics is None:
+            with self.lock:
+                metrics = self.components.setdefault(ip, ComponentMetrics(ip, name))
+        if name:
+            metrics.name = name
+        return metrics
+
+    def to_json(self) -> dict:
+        with self.lock:
+            components = list(self.components.values())
+        return {"start": self.start, "time": time.time(),
+                "components": [metrics.snapshot() for metrics in components]}
+
+    def to_prometheus(self) -> str:
+        with self.lock:
+            components = list(self.components.values())
+        lines = []
+        counters = [("commands", "Answered commands"), ("bytes_out", "Bytes sent"),
+                    ("bytes_in", "Bytes received"), ("timeouts", "Commands without reply in time"),
+                    ("socket_errors", "Socket errors"), ("retries", "Reconnects of dead sessions"),
+                    ("unexpected", "Messages that did not answer a command")]
+        for counter, description in counters:
+            lines.append(f"# HELP comp_mgr_{counter}_total {description}")
+            lines.append(f"# TYPE comp_mgr_{counter}_total counter")
+            for metrics in components:
+                lines.append(f'comp_mgr_{counter}_total{{ip="{metrics.ip}",component="{metrics.name or ""}"}} '
+                             f'{getattr(metrics, counter)}')
+
+        lines.append("# HELP comp_mgr_command_latency_seconds Round-trip time of commands by family")
+        lines.append("# TYPE comp_mgr_command_latency_seconds histogram")
+        for metrics in components:
+            for family, histogram in sorted(metrics.latency.items()):
+                labels = f'ip="{metrics.ip}",component="{metrics.name or ""}",family="{family}"'
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'comp_mgr_command_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"comp_mgr_command_latency_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"comp_mgr_command_latency_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str = PATH) -> tuple[str, str]:
+        """Write path.json and path.prom"""
+        json_path, prometheus_path = f"{path}.json", f"{path}.prom"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(json_path, "w") as file:
+                json.dump(self.to_json(), file, indent=2)
+            with open(prometheus_path, "w") as file:
+                file.write(self.to_prometheus())
+            logger.debug(f"Metrics saved to {json_path} and {prometheus_path}")
+        except OSError as e:
+            logger.warning(f"Unable to save metrics: {e}")
+        return json_path, prometheus_path
+
+    def save_if_used(self) -> None:
+        if self.components:
+            self.save()
+
+METRICS = Metrics()
+atexit.register(METRICS.save_if_used)
@@ -0,0 +1,90 @@
+"""
+Backup planner
+
+Compiles the backup schema of an identifier (config.BACKUP_SCHEMAS) into the get commands of a
+backup. The whole plan is known before the first command is sent, so a backup can be counted,
+pipelined as one stream and estimated ahead of time.
+"""
+import logging
+from comp_mgr.config import BACKUP_SCHEMAS
+
+logger = logging.getLogger(__name__)
+
+# Parameters that are read before planning, because conditions depend on them
+FACTS = {
+    "xaxis": "DEQU.STDT[18]",       # Robot has a linear track
+    "arm_config": "DEQU.STDT[16]",  # Arm types of the robot
+}
+
+def framed_arm(arm_config: int) -> bool:
+    """Whether one of the arms is a framed arm (type 25)"""
+    arm1 = hex(arm_config)[-4:-2]
+    arm2 = hex(arm_config)[-6:-4]
+    logger.debug(f"arm config: {arm1}, {arm2}")
+    return "25" in (arm1, arm2)
+
+# Conditions of schema entries: name -> (fact, test of the fact value)
+CONDITIONS = {
+    "linear_track": ("xaxis", lambda xaxis: xaxis != 0),
+    "no_linear_track": ("xaxis", lambda xaxis: xaxis == 0),
+    "framed_arm": ("arm_config", framed_arm),
+}
+
+def schema(identifier: str) -> list[dict]:
+    if identifier not in BACKUP_SCHEMAS:
+        error = f"Backup not implemented for component {identifier}"
+        logger.error(error)
+        raise Exception(error)
+    return BACKUP_SCHEMAS[identifier]
+
+def required_facts(identifier: str) -> list[str]:
+    """Facts the conditions of a schema depend on, in the order they are needed"""
+    facts = [CONDITIONS[entry["when"]][0] for entry in schema(identifier) if "when" in entry]
+    return list(dict.fromkeys(facts))
+
+def compile_block(name: str, block: str | None, rows: int | list[int], set_command: str,
+                  leading: bool = False) -> tuple[str, list[tuple[str, str]]]:
+    """
+    One block of the plan: the reply prefix and the rows, each a tuple of the get command
+    and the start of the line in the backup file, e.g.
+    ('aTRB0.DRCS.GTDT:', [('oTRB0.DRCS.GTDT[0]', 'DRCS.STDT[0]='), ...])
+    """
+    get_command = f"G{set_command[1:]}"  # Turns STDT into GTDT
+    target = f"{name}.{block}" if block else name
+    line_block = f"{block}." if block else ""
+    prefix = f"a{target}.{get_command[:4]}:"  # Cuts the bracket of the get command GTDT[000]
+
+    block_range = range(rows) if isinstance(rows, int) else rows
+    if len(block_range) == 1:
+        return prefix, [(f"o{target}.{get_command}", f"{line_block}{set_command}=")]
+    block_rows = []
+    for i in block_range:
+        idx = f"{i:03}" if leading else i
+        block_rows.append((f"o{target}.{get_command}[{idx}]", f"{line_block}{set_command}[{idx}]="))
+    return prefix, block_rows
+
+def compile_plan(name: str, identifier: str, facts: dict | None = None) -> list[tuple[str, list[tuple[str, str]]]]:
+    """The blocks of a backup in file order, see compile_block"""
+    facts = facts or {}
+    plan = []
+    for entry in schema(identifier):
+        if "when" in entry:
+            fact, test = CONDITIONS[entry["when"]]
+            if not test(facts.get(fact, 0)):
+                continue
+        for i in range(entry.get("repeat", 1)):
+            command = entry["command"].format(i=i)
+            plan.append(compile_block(name, entry["block"], entry["rows"], command, entry.get("leading", False)))
+    return plan
+
+def plan_rows(plan: list[tuple[str, list[tuple[str, str]]]]) -> int:
+    return sum(len(rows) for _, rows in plan)
+
+def plan_commands(plan: list[tuple[str, list[tuple[str, str]]]]) -> tuple[list[str], list[str]]:
+    """All get commands of a plan with their reply prefixes (without ':'), to be pipelined as one stream"""
+    commands, prefixes = [], []
+    for prefix, rows in plan:
+        for command, _ in rows:
+            commands.append(command)
+            prefixes.append(prefix[:-1])
+    return commands, prefixes
@@ -0,0 +1,96 @@
+"""
+Progress module
+
+Progress of bulk operations on a component, such as a backup. The communication methods count
+every reply, the UI renders the progress whenever it draws. Throughput is measured over the
+last few seconds only, such that a stalled component is visible as a drop to 0/s.
+"""
+import threading
+import time
+from collections import deque
+
+class Progress:
+    """
+    One bulk operation, e.g. Progress("Backup", 3476):
+        progress.start_block("DTRB.STDA")
+        progress.step(len(reply))
+        progress.render() -> 'Backup DTRB.STDA 1200/3476 (35%), 850 cmd/s, 61.3 kB/s, ETA 3s'
+    step() is called from the worker, render() and event() from any thread.
+    """
+    # Seconds over which throughput is measured
+    WINDOW = 3.0
+    # Seconds without a reply after which the operation is shown as stalled
+    STALL = 2.0
+
+    def __init__(self, operation: str, total: int):
+        self.operation = operation
+        self.total = total
+        self.block = ""
+        self.done = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.last_step = self.start
+        self.end = None
+        self.lock = threading.Lock()
+        # (time, done, bytes), the first sample lies before the window
+        self.samples = deque([(self.start, 0, 0)])
+
+    def start_block(self, block: str) -> None:
+        self.block = block
+
+    def step(self, nbytes: int = 0) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.done += 1
+            self.bytes += nbytes
+            self.last_step = now
+            self.samples.append((now, self.done, self.bytes))
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        """Keep the samples of the window, and the last one before it"""
+        while len(self.samples) > 1 and self.samples[1][0] < now - self.WINDOW:
+            self.samples.popleft()
+
+    def finish(self) -> None:
+        self.end = time.monotonic()
+
+    def rate(self) -> tuple[float, float]:
+        """Commands and bytes per second over the last WINDOW seconds"""
+        now = self.end or time.monotonic()
+        with self.lock:
+            # Without replies, the window moves on and the rate drops to 0
+            self._prune(now)
+            base_time, base_done, base_bytes = self.samples[0]
+            done, nbytes = self.done, self.bytes
+        if self.end is not None:
+            # Finished operations report their average
+            base_time, base_done, base_bytes = self.start, 0, 0
+        elapsed = max(now - base_time, 1e-6)
+        return (done - base_done) / elapsed, (nbytes - base_bytes) / elapsed
+
+    def event(self) -> dict:
+        commands_per_s, bytes_per_s = self.rate()
+        remaining = max(self.total - self.done, 0)
+        eta = remaining / commands_per_s if commands_per_s > 0 else None
+        now = self.end or time.monotonic()
+        stalled = now - self.last_step if self.end is None and now - self.last_step > self.STALL else 0
+        return {"operation": self.operation, "block": self.block, "done": self.done, "total": self.total,
+                "commands_per_s": commands_per_s, "bytes_per_s": bytes_per_s, "eta": eta,
+                "stalled": stalled, "elapsed": now - self.start}
+
+    def render(self) -> str:
+        event = self.event()
+        percent = 100 * event["done"] // event["total"] if event["total"] else 100
+        text = (f"{event['operation']} {event['block']} {event['done']}/{event['total']} ({percent}%), "
+                f"{event['commands_per_s']:.0f} cmd/s, {event['bytes_per_s'] / 1000:.1f} kB/s")
+        if event["stalled"]:
+            return f"{text}, STALLED for {event['stalled']:.0f}s"
+        if event["eta"] is not None and self.end is None:
+            return f"{text}, ETA {event['eta']:.0f}s"
+        return text
+
+    def summary(self) -> str:
+        event = self.event()
+        return (f"{event['operation']}: {event['done']} commands in {event['elapsed']:.1f}s "
+                f"({event['commands_per_s']:.0f} cmd/s, {self.bytes / 1000:.1f} kB)")
@@ -0,0 +1,166 @@
+"""
+Restore module
+
+Writes a backup created by Rorze.read_data back to a component. Only the rows that differ
+from the live component are sent, pipelined, and everything ends in a single flash write.
+Backups are read from the backup store (see block_store), or from .dat files of older versions.
+Backups of another unit of the same type never overwrite the serial number, IP address and
+body number of the component.
+"""
+import logging
+import os
+from pathlib import Path
+from comp_mgr import backup_format
+
+logger = logging.getLogger(__name__)
+
+# Filters offered in the component menu: label -> blocks (None restores everything)
+RESTORE_FILTERS = {
+    "Everything": None,
+    "Teaching tables (DTRB, DTUL)": ["DTRB", "DTUL"],
+    "Equipment data (DEQU)": ["DEQU"],
+}
+
+def read_backup(store, backup) -> list[tuple[str, str]]:
+    """
+    All (parameter, value) rows of a backup, e.g. ("DTRB.STDA[37]", "...").
+    backup is the name of a backup in the store, or the path of a .dat file. If the indexed
+    container exists next to the .dat, it is read and checked instead.
+    """
+    path = Path(backup)
+    container = path.with_suffix(backup_format.EXTENSION)
+    if store.has_backup(str(backup)):
+        lines = store.lines(str(backup))
+    elif os.path.exists(container):
+        with backup_format.BackupReader(container) as reader:
+            lines = list(reader.lines())
+    else:
+        with open(path, "r") as file:
+            lines = [line.rstrip("\n") for line in file if line.strip()]
+
+    parameters = []
+    for line in lines:
+        parameter, separator, value = line.partition("=")
+        if not separator:
+            raise ValueError(f"Unexpected line in backup {path}: {line}")
+        parameters.append((parameter, value))
+    return parameters
+
+def backup_header(store, backup) -> dict:
+    """
+    Identity of the component the backup was taken from (Identifier, SN, Firmware, ...).
+    Plain .dat files only tell the start of the identifier (Prefix) and the serial number by their name.
+    """
+    if store.has_backup(str(backup)):
+        return store.header(str(backup))
+    container = Path(backup).with_suffix(backup_format.EXTENSION)
+    if os.path.exists(container):
+        with backup_format.BackupReader(container) as reader:
+            return reader.header
+    # e.g. RR754_1234_20260101_1_ORG.dat
+    fields = Path(backup).stem.split("_")
+    return {"Prefix": fields[0], "SN": fields[1] if len(fields) > 1 else None}
+
+def check_model(component, header: dict) -> None:
+    """The backup has to be of the same model, e.g. a RA320_002 backup does not fit a RA320_003"""
+    identifier = header.get("Identifier")
+    if identifier is not None:
+        fits = identifier == component.identifier
+    else:
+        identifier = header.get("Prefix") or ""
+        fits = bool(identifier) and component.identifier.startswith(identifier)
+    if not fits:
+        raise ValueError(f"Backup of {identifier} does not fit component {component.identifier}")
+
+def backup_warnings(component, backup) -> list[str]:
+    """
+    Differences between the component and the one the backup was taken from, to be confirmed before a restore.
+    Raises ValueError if the backup is of another model.
+    """
+    header = backup_header(component.backup_store(), backup)
+    check_model(component, header)
+    warnings = []
+    if header.get("Identifier") is None:
+        warnings.append(f"The model of the backup is unknown, only that it starts with {header['Prefix']}. "
+                        f"This component is {component.identifier}.")
+    if header.get("SN") != component.sn:
+        warnings.append(f"The backup is from serial number {header.get('SN')}, this component is {component.sn}. "
+                        f"Its serial number, IP address and body number are kept.")
+    if header.get("Firmware") is None:
+        warnings.append(f"The firmware of the backup is unknown, this component runs {component.firmware}.")
+    elif header["Firmware"] != component.firmware:
+        warnings.append(f"The backup is from firmware {header['Firmware']}, this component runs {component.firmware}.")
+    return warnings
+
+def identity_rows(component) -> set[str]:
+    """Rows that belong to the unit rather than to its type: serial number, own IP address and body number"""
+    parameters = [("DEQU.STDT[0]", None)]
+    parameters += component.ip_parameters(component.ip) or []
+    parameters += component.body_no_parameters(0) or []
+    return {parameter for parameter, _ in parameters}
+
+def split_fields(value: str) -> list[str]:
+    """Values of a whole table row, e.g. '"1234",192.168.0.1,12000' (commas in quotes do not split)"""
+    fields = [""]
+    quoted = False
+    for char in value:
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            fields.append("")
+            continue
+        fields[-1] += char
+    return fields
+
+def without_rows(parameters: list[tuple[str, str]], excluded: set[str]) -> list[tuple[str, str]]:
+    """
+    Drop the excluded rows. A whole table row that contains one of them (e.g. DEQU.STDT with the
+    serial number at DEQU.STDT[0]) is split up, and only its other fields are kept.
+    """
+    kept = []
+    for parameter, value in parameters:
+        if parameter in excluded:
+            continue
+        if not any(row.startswith(f"{parameter}[") for row in excluded):
+            kept.append((parameter, value))
+            continue
+        for i, field in enumerate(split_fields(value)):
+            if f"{parameter}[{i}]" not in excluded:
+                kept.append((f"{parameter}[{i}]", field))
+    return kept
+
+def select(parameters: list[tuple[str, str]], blocks: list[str] | None = None,
+           rows: list[str] | None = None) -> list[tuple[str, str]]:
+    """Only keep the rows of the given blocks (e.g. 'DTRB') and/or single rows (e.g. 'DEQU.STDT')"""
+    if blocks is None and rows is None:
+        return parameters
+    blocks = set(blocks or [])
+    rows = set(rows or [])
+    return [(parameter, value) for parameter, value in parameters
+            if parameter.split(".")[0] in blocks or parameter in rows]
+
+def restore(component, backup, blocks: list[str] | None = None, rows: list[str] | None = None) -> list[tuple[str, str]]:
+    """
+    Restore a backup (name in the backup store or .dat path), or the chosen blocks and rows of it,
+    to the component. Returns the parameters that were changed.
+    """
+    store = component.backup_store()
+    header = backup_header(store, backup)
+    check_model(component, header)
+
+    parameters = select(read_backup(store, backup), blocks, rows)
+    if header.get("SN") != component.sn:
+        # A backup of another unit must not give this one its serial number or IP address
+        excluded = identity_rows(component)
+        parameters = without_rows(parameters, excluded)
+        logger.warning(f"Backup {backup} is from serial number {header.get('SN')}, keeping {', '.join(sorted(excluded))} "
+                       f"of {component.sn}")
+    logger.info(f"Restoring {len(parameters)} rows from {backup} to {component.identifier} {component.sn}")
+    component.status = f"Restoring {len(parameters)} rows..."
+
+    with component.transaction():
+        changed = component.apply_parameters(parameters)
+
+    component.status = f"Restored {len(changed)} of {len(parameters)} rows from {Path(backup).name}"
+    logger.info(component.status)
+    return changed
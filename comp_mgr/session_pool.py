@@ -0,0 +1,111 @@
+"""
+Session pool
+
+Keeps one live, identified Rorze session per IP for the whole program, such that opening a
+component menu or starting the autosetup does not pay a TCP handshake and CNCT wait every time.
+"""
+import atexit
+import concurrent.futures
+import logging
+import socket
+import threading
+from comp_mgr.cache import COMPONENT_CACHE
+from comp_mgr.comp import Rorze
+
+logger = logging.getLogger(__name__)
+
+class SessionPool:
+
+    def __init__(self):
+        self.sessions = {}
+        # Futures of lookups in progress, concurrent lookups of the same IP wait for them
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, comp_info: dict, simulation: bool = False,
+                    sock: socket.socket | None = None) -> Rorze | None:
+        """
+        Return a live session for comp_info['IP'], or None if no Rorze component answers.
+        A pooled session is checked with a liveness probe and reconnected if it is dead.
+        A connected socket (e.g. from the discovery probe) is used for a new session, or closed.
+        """
+        if simulation:
+            return Rorze(comp_info, simulation)
+
+        ip = comp_info["IP"]
+        with self.lock:
+            future = self.pending.get(ip)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.pending[ip] = future
+
+        if not owner:
+            logger.debug(f"SessionPool.get_session() -> Waiting for lookup of {ip} in progress")
+            if sock is not None:
+                sock.close()
+            session = future.result()
+        else:
+            try:
+                session = self.lookup(comp_info, sock)
+                future.set_result(session)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.lock:
+                    del self.pending[ip]
+
+        # The caller may configure for a different system (e.g. autosetup)
+        if session and comp_info.get("System"):
+            session.system = comp_info["System"]
+        return session
+
+    def lookup(self, comp_info: dict, sock: socket.socket | None = None) -> Rorze | None:
+        ip = comp_info["IP"]
+        session = self.sessions.get(ip)
+        if session is not None:
+            if self.is_alive(session):
+                logger.debug(f"SessionPool.lookup() -> Reusing session to {ip}")
+                if sock is not None:
+                    sock.close()
+                return session
+            logger.info(f"Session to {ip} is dead, reconnecting...")
+            session.metrics.retries += 1
+            self.discard(ip)
+
+        # Skip the version round-trip, if the same component (banner and serial number) is still there
+        session = Rorze(comp_info, sock=sock)
+        if not session.identify(COMPONENT_CACHE.get(ip)):
+            session.close_connection()
+            return None
+
+        ip_info = {key: comp_info.get(key) for key in ("IP", "System", "Type")}
+        COMPONENT_CACHE.put({**ip_info, **session.identity()}, session.type)
+        self.sessions[ip] = session
+        return session
+
+    def is_alive(self, session: Rorze) -> bool:
+        """Cheap liveness probe: The component has to answer a STAT command"""
+        if not session.connected:
+            return False
+        prefix = f"a{session.name}.STAT"
+        try:
+            reply = session.send_and_read(f"{session.read_name()}.STAT")
+        except socket.error as e:
+            logger.debug(f"SessionPool.is_alive() -> {session.ip}: {e}")
+            return False
+        # A different reply means an old reply was still on its way, so the session is out of sync
+        return reply.startswith(prefix)
+
+    def discard(self, ip: str) -> None:
+        session = self.sessions.pop(ip, None)
+        if session is not None:
+            session.close_connection()
+
+    def close_all(self) -> None:
+        for ip in list(self.sessions):
+            self.discard(ip)
+
+SESSION_POOL = SessionPool()
+atexit.register(SESSION_POOL.close_all)
@@ -1,17 +1,20 @@
+import concurrent.futures
 import copy
 import curses
 import logging
-import os
 import sys
 import time
-from comp_mgr.comp import Rorze
+from comp_mgr.session_pool import SESSION_POOL
 from comp_mgr.config import NETWORK, CONFIG_MENU_OPTIONS
 from comp_mgr.exceptions import *
-from comp_mgr.ui.common_ui import PopupMenu, draw_status_popup, ScrollingLog
+from comp_mgr.ui.common_ui import PopupMenu, draw_status_popup, redraw_timeout, Screen, ScrollingLog, WAKEUP
 
 logger = logging.getLogger(__name__)
 
 class AutosetupMenu:
+    # Number of components that are set up at the same time
+    MAX_WORKERS = 6
+
     def __init__(self, ip_list, component_dict, simulation):
         self.ip_list = ip_list
         self.button_list = []
@@ -25,8 +28,9 @@ class AutosetupMenu:
     def set_status(self, msg, duration=3):
         self.status_message = msg
         self.status_until = time.time() + duration
+        WAKEUP.notify()
 
-    def draw(self, stdscr, current_row):
+    def draw(self, screen, current_row):
         button_list = []
 
         # Create a button list from component list
@@ -38,16 +42,12 @@ class AutosetupMenu:
         self.button_list = button_list
 
         for i, row in enumerate(self.button_list):
-            if i == current_row:
-                stdscr.attron(curses.color_pair(1))
-                stdscr.addstr(i + 2, 4, row)
-                stdscr.attroff(curses.color_pair(1))
-            else:
-                stdscr.addstr(i + 2, 4, row)
-            
+            attr = curses.color_pair(1) if i == current_row else 0
+            screen.put(i + 2, 4, row, attr)
+
         # For debugging, show the entire dict and system config
         # offset = self.ncomponents + len(self.menu_items) + 4
-        # stdscr.addstr(offset, 4, f"Config: {self.system}")
+        # screen.put(offset, 4, f"Config: {self.system}")
         # for i, component in self.all_components.items():
         #     config_items = []
         #     display_name = f'{component['Type']}: '
@@ -60,10 +60,10 @@ class AutosetupMenu:
             
         #     display_config = " | ".join(config_items)
         #     display_full = display_name+display_config
-        #     stdscr.addstr(offset + 1 + i, 4, display_full[:curses.COLS - 8])
+        #     screen.put(offset + 1 + i, 4, display_full[:curses.COLS - 8])
 
-        draw_status_popup(stdscr, self.status_message, self.status_until)
-        stdscr.refresh()
+        draw_status_popup(screen, self.status_message, self.status_until)
+        screen.render()
 
     def run(self, stdscr):
 
@@ -77,17 +77,18 @@ class AutosetupMenu:
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
         current_row = 0
-        stdscr.timeout(500)
+        screen = Screen(stdscr)
 
         while True:
-            stdscr.clear()
-            self.draw(stdscr, current_row)
-            key = stdscr.getch()
+            self.draw(screen, current_row)
+            key = WAKEUP.wait(stdscr, redraw_timeout(self.status_until))
             if key == curses.KEY_UP:
                 current_row = (current_row - 1) % len(self.button_list)
             elif key == curses.KEY_DOWN:
                 current_row = (current_row + 1) % len(self.button_list)
             elif key == ord('\n'):
+                # Popups and the autosetup log draw over the menu
+                screen.invalidate()
                 selected = self.button_list[current_row]
                 if selected == '- Start Autosetup':
                     self.autosetup(stdscr)
@@ -111,9 +112,6 @@ class AutosetupMenu:
         popup = PopupMenu(stdscr, "Choose System", options)
         self.system = popup.run()
 
-        stdscr.clear()
-        stdscr.refresh()
-
         if self.system == None:
             return None
 
@@ -145,8 +143,6 @@ class AutosetupMenu:
         logger.debug(f"{config_dict}")
         popup = PopupMenu(stdscr, "Select Configuration", config_dict)
         popup.run()
-        stdscr.clear()
-        stdscr.refresh()
 
     def get_button(self, index) -> str:
         component = self.all_components[index]
@@ -328,100 +324,100 @@ class AutosetupMenu:
     
     def autosetup(self, stdscr):
         """
-        Define here, which actions are taken when a Config_List entry is read.
+        Run the autosetup of every component that should be configured. Each component runs
+        in its own worker, at most MAX_WORKERS at once. Workers only report to the log,
+        the screen is drawn from here.
         """
         # Start the log screen
         log = ScrollingLog(stdscr)
         log.add("Starting Autosetup...")
 
-        for i, entry in self.all_components.items():
-            
-            # Check, if component should be configured
-            if not entry['Config_List']['Configure']['enabled']: continue
-
-            # Connect to component
-            component = Rorze(entry, self.simulation)
-
-            # temporary parsing - change to component.ip later
-            ip = entry["IP"]
-            identifier = entry["Identifier"]
-            sn = entry["SN"]
-
-            log.add(f"########## Processing {entry["Identifier"]} {entry["SN"]} ##########")
-            # Save original component backup
-            infostring = "Saving original component backup..."
-            logger.info(infostring)
-            log.add(infostring)
-            component.read_data(suffix='_ORG')
-            files = os.listdir()
-            if not any(f'{sn}' in f for f in files):
-                logger.error(f"Error during autosetup - No backup file was created for {sn}")
-                logger.debug(f"Directory files: {files}")
-                raise NoBackup("No backup file was created")
-
-            # Start going through the possible config actions
-            for config_item, config in entry['Config_List'].items():
-
-                # If slow mode is NOT chosen -> check if speed needs to be restored to normal                
-                if not config['enabled']:
-                   if config_item == "Slow_Mode":
-                       component.set_aligner_speed(speed='Normal',write=0)
-
-                if config['enabled']:
-                    if config_item == "Target_IP":
-                        new_ip = config["value"]
-                        if ip != new_ip:
-                            infostring = f"Changing IP of {identifier} from {ip} to {new_ip}" 
-                            logger.info(infostring)
-                            log.add(infostring)
-                            component.change_IP(new_ip,write=0)
-                    if config_item == "Notch_Angle":
-                        notch_angle = config["value"]
-                        infostring = f"Setting notch angle of to {notch_angle} mdeg"
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.set_notch_angle(notch_angle,write=0)
-                    elif config_item == "Basic_Settings":
-                        infostring = "Applying basic settings..."
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.basic_settings(write=0)
-                    elif config_item == "Spindle_Fix":
-                        infostring = "Removing Aligner Spindle offset..."
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.spindle_fix(write=0)
-                    elif config_item == "No_Interpolation":
-                        infostring = "Disabling Interpolation..."
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.no_interpolation(write=0)
-                    elif config_item == "Flip_Near":
-                        infostring = "Enabling flipping option of retracted arm..."
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.set_flip_near("On",write=0)
-                    elif config_item == "Set_Body_Number":
-                        body_no = config["value"]
-                        infostring = f"Setting body number of {identifier} to {body_no}..."
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.set_body_no(body_no,write=0)
-                    elif config_item == "Slow_Mode":
-                        infostring = "Reducing aligner speed for external notch camera"
-                        logger.info(infostring)
-                        log.add(infostring)
-                        component.set_aligner_speed(speed='Slow',write=0)
-                    
-            log.add("Writing changes to flash memory...")
-            component.write_changes()
-
-            log.add("Saving component backup...")
-            # Save altered component backup
-            component.read_data()
-
-            logger.info(f"#################### Autosetup complete for {identifier} ####################")
-
-        log.add("Autosetup done. Press any key to return...")
-        stdscr.timeout(-1)
-        stdscr.getch()
+        entries = [entry for entry in self.all_components.values() if entry['Config_List']['Configure']['enabled']]
+        for entry in entries:
+            log.set_status(self.get_label(entry), f"{self.get_label(entry)}: Waiting...")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            futures = {executor.submit(self.autosetup_component, entry, log): entry for entry in entries}
+            for future in futures:
+                future.add_done_callback(lambda _: WAKEUP.notify())
+            # The log wakes the screen up, live progress is redrawn every Wakeup.TICK, keys scroll the log
+            while not all(future.done() for future in futures):
+                log.draw()
+                log.handle_key(WAKEUP.wait(stdscr, WAKEUP.TICK))
+
+        for future, entry in futures.items():
+            label = self.get_label(entry)
+            error = future.exception()
+            if error:
+                logger.error(f"Autosetup failed for {label}: {error}")
+                log.add(f"{label} Autosetup FAILED: {error}")
+                log.set_status(label, f"{label}: FAILED - {error}")
+
+        log.add("Autosetup done. Press any key to return, PGUP/PGDN to scroll...")
+        log.draw()
+        while True:
+            key = WAKEUP.wait(stdscr)
+            if key != -1 and not log.handle_key(key):
+                break
+            log.draw()
+
+    def get_label(self, entry) -> str:
+        return f"[{entry['Identifier']} {entry['SN']}]"
+
+    def autosetup_component(self, entry, log):
+        """
+        Define here, which actions are taken when a Config_List entry is read.
+        """
+        label = self.get_label(entry)
+        component = None
+
+        def report(infostring):
+            logger.info(f"{label} {infostring}")
+            log.add(f"{label} {infostring}")
+
+            def status():
+                # Live progress of backups and parameter reads, rendered whenever the log is drawn
+                progress = component.progress if component else None
+                if progress:
+                    return f"{label}: {infostring} {progress.render()}"
+                return f"{label}: {infostring}"
+            log.set_status(label, status)
+
+        # Connect to component
+        report("Connecting...")
+        component = SESSION_POOL.get_session(entry, self.simulation)
+        if component is None:
+            raise ConnectionError(f"Unable to connect to {entry['IP']}")
+
+        # temporary parsing - change to component.ip later
+        identifier = entry["Identifier"]
+        sn = entry["SN"]
+
+        log.add(f"########## Processing {entry["Identifier"]} {entry["SN"]} ##########")
+        # Save original component backup
+        report("Saving original component backup...")
+        backup = component.read_data(suffix='_ORG', pipelined=True)
+        if backup is None or not component.backup_store().catalog.exists(backup):
+            logger.error(f"Error during autosetup - No backup was created for {sn}")
+            raise NoBackup("No backup was created")
+
+        # Bring the component to the state of its config list, only real differences are written
+        report("Reading current configuration...")
+        state = component.desired_state(entry['Config_List'])
+        report(f"Applying: {', '.join(state.items) or 'nothing'}")
+        # One flash write on success, the original values are restored on failure
+        with component.transaction():
+            changed = component.apply_parameters(state.parameters())
+            if changed:
+                report(f"Writing {len(changed)} changes to flash memory...")
+        if not changed:
+            report("Already configured, nothing to write")
+            logger.info(f"#################### {identifier} was already configured ####################")
+            return
+
+        report("Saving component backup...")
+        # Save altered component backup
+        component.read_data(pipelined=True)
+
+        report("Done")
+        logger.info(f"#################### Autosetup complete for {identifier} ####################")
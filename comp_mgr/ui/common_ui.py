@@ -1,28 +1,169 @@
 import curses
+import os
+import selectors
+import sys
+import threading
 import time
 import logging
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
-def draw_status_popup(stdscr, msg: str, until):
-    """Draw a temporary popup box centered at the bottom of the screen."""
+class Wakeup:
+    """
+    Wakes the UI thread when a worker thread changed something that is shown. The UI waits on
+    stdin and a self-pipe at once (selectors), workers call notify(), and the UI redraws right
+    away instead of polling. Notifications are coalesced, the pipe holds at most one byte until
+    the UI woke up. The state itself is read from the menus and components when drawing.
+    On Windows, where stdin can't be selected, the keyboard is polled every POLL seconds.
+    """
+    # Redraw interval while something changes without notifying, e.g. live progress
+    TICK = 0.2
+    POLL = 0.05
+
+    def __init__(self):
+        self.pending = False
+        self.selector = None
+        if os.name != "nt":
+            self.reader, self.writer = os.pipe()
+            os.set_blocking(self.reader, False)
+            os.set_blocking(self.writer, False)
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.reader, selectors.EVENT_READ)
+        self.stdin = None
+
+    def notify(self) -> None:
+        """Called from any thread"""
+        if self.pending:
+            return
+        self.pending = True
+        if self.selector is not None:
+            try:
+                os.write(self.writer, b"\0")
+            except BlockingIOError:
+                pass
+
+    def _drain(self) -> None:
+        self.pending = False
+        if self.selector is None:
+            return
+        try:
+            while os.read(self.reader, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, stdscr, timeout: float | None = None) -> int:
+        """
+        Wait until a key is pressed, a worker notified or timeout seconds passed (None: forever).
+        Returns the key, or -1 if the screen should be redrawn.
+        """
+        # Keys that curses already read from stdin don't wake the selector
+        stdscr.nodelay(True)
+        try:
+            key = stdscr.getch()
+            if key != -1 or self.pending:
+                self._drain()
+                return key
+            if self.selector is None:
+                return self._poll(stdscr, timeout)
+            if self.stdin is None:
+                self.stdin = sys.stdin.fileno()
+                self.selector.register(self.stdin, selectors.EVENT_READ)
+            self.selector.select(timeout)
+            key = stdscr.getch()
+            self._drain()
+            return key
+        finally:
+            stdscr.nodelay(False)
+
+    def _poll(self, stdscr, timeout: float | None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stdscr.timeout(int(self.POLL * 1000))
+        try:
+            while True:
+                key = stdscr.getch()
+                if key != -1 or self.pending or (deadline is not None and time.monotonic() >= deadline):
+                    self._drain()
+                    return key
+        finally:
+            stdscr.timeout(-1)
+
+WAKEUP = Wakeup()
+
+def redraw_timeout(*deadlines: float) -> float | None:
+    """Seconds until the earliest of the deadlines (time.time()) in the future, None if there is none"""
+    now = time.time()
+    pending = [deadline - now for deadline in deadlines if deadline > now]
+    return min(pending) if pending else None
+
+class Screen:
+    """
+    Damage-tracking renderer of a curses window. Menus describe the whole screen on every frame
+    with put(), render() only rewrites the rows whose text or attributes changed since the last
+    frame and sends them to the terminal in one doupdate(). An unchanged frame sends nothing.
+    """
+    def __init__(self, win):
+        self.win = win
+        self.win.leaveok(True)  # The cursor is hidden, don't move it around after every update
+        self.rows = {}  # y -> [(x, text, attr), ...] on the terminal
+        self.frame = {}  # y -> [(x, text, attr), ...] of the frame being described
+        self.size = None
+
+    def getmaxyx(self) -> tuple[int, int]:
+        return self.win.getmaxyx()
+
+    def put(self, y: int, x: int, text: str, attr: int = 0) -> None:
+        self.frame.setdefault(y, []).append((x, text, attr))
+
+    def invalidate(self) -> None:
+        """Redraw everything on the next render, e.g. after a popup or another menu drew over the screen"""
+        self.size = None
+
+    def render(self, update: bool = True) -> bool:
+        """
+        Write the changed rows. With update=False, the caller adds its own windows before calling
+        curses.doupdate(). Returns whether the whole window was redrawn.
+        """
+        size = self.win.getmaxyx()
+        redrawn = size != self.size
+        if redrawn:
+            self.size = size
+            self.rows = {}
+            self.win.erase()
+        height, width = size
+        for y in self.rows.keys() | self.frame.keys():
+            segments = self.frame.get(y, [])
+            if self.rows.get(y) == segments or y >= height:
+                continue
+            try:
+                self.win.move(y, 0)
+                self.win.clrtoeol()
+                for x, text, attr in segments:
+                    if x < width:
+                        self.win.addstr(y, x, text[:width - x], attr)
+            except curses.error:
+                pass  # Writing the bottom right corner moves the cursor off the screen
+        self.rows, self.frame = self.frame, {}
+        self.win.noutrefresh()
+        if update:
+            curses.doupdate()
+        return redrawn
+
+def draw_status_popup(screen: Screen, msg: str, until):
+    """Draw a temporary popup box centered at the top of the screen."""
     if not msg or time.time() >= until:
         return
-    
-    height, width = stdscr.getmaxyx()
+
+    height, width = screen.getmaxyx()
     box_width = len(msg) + 4
 
     start_y = 0
-    start_x = (width - box_width) // 2
+    start_x = max(0, (width - box_width) // 2)
 
-    try:
-        stdscr.attron(curses.A_BLINK)
-        stdscr.addstr(start_y, start_x, "+" + "-" * (box_width - 2) + "+")
-        stdscr.addstr(start_y + 1, start_x, "| " + msg + " |")
-        stdscr.addstr(start_y + 2, start_x, "+" + "-" * (box_width - 2) + "+")
-        stdscr.attroff(curses.A_BLINK)
-    except curses.error:
-        pass # Ignore if terminal is too small
+    screen.put(start_y, start_x, "+" + "-" * (box_width - 2) + "+", curses.A_BLINK)
+    screen.put(start_y + 1, start_x, "| " + msg + " |", curses.A_BLINK)
+    screen.put(start_y + 2, start_x, "+" + "-" * (box_width - 2) + "+", curses.A_BLINK)
 
 class PopupMenu:
     def __init__(self, stdscr, title, config):
@@ -192,10 +333,11 @@ class PopupMenu:
         del win  # Cleanup window
 
 class PopupInput:
-    def __init__(self, stdscr, title, text):
+    def __init__(self, stdscr, title, text, max_length=20):
         self.stdscr = stdscr
         self.title = title
         self.text = text
+        self.max_length = max_length
         self.input = None
     
     def draw(self):
@@ -219,7 +361,7 @@ class PopupInput:
         win.addstr(win_height - 2,2,f"{self.text} ")
 
         curses.echo()
-        new_val = win.getstr(win_height - 2, text_length + 2, 20).decode("utf-8")
+        new_val = win.getstr(win_height - 2, text_length + 2, self.max_length).decode("utf-8")
         curses.noecho()
         if new_val == '':
             return
@@ -227,35 +369,192 @@ class PopupInput:
             logger.debug(f"value received: {new_val}")
             return new_val
 
-class ScrollingLog:
-    def __init__(self, stdscr, max_lines=1000):
-        self.buffer = []
-        self.max_lines = max_lines
+class PopupText:
+    """Scrollable, read-only text popup (UP/DOWN, PGUP/PGDN, HOME/END, ENTER or ESC to close)"""
+    def __init__(self, stdscr, title, lines: list[str]):
         self.stdscr = stdscr
+        self.title = title
+        self.lines = lines
+        self.top = 0
 
-    def add(self, line: str, start_y=1, start_x=1, height=None, width=None):
-        """Add a new line to the log"""
-        self.buffer.append(line)
+    def run(self):
+        height, width = self.stdscr.getmaxyx()
+        win_height = max(5, height - 4)
+        win_width = max(20, width - 8)
+        win = curses.newwin(win_height, win_width, (height - win_height) // 2, (width - win_width) // 2)
+        win.keypad(True)
+        n_visible = win_height - 2
+        last_top = max(0, len(self.lines) - n_visible)
 
-        # Prevent unlimited growth
-        if len(self.buffer) > self.max_lines:
-            self.buffer.pop(0)
+        while True:
+            win.erase()
+            win.box()
+            win.attron(curses.A_BOLD)
+            win.addstr(0, 2, f" {self.title} "[:win_width - 4])
+            win.attroff(curses.A_BOLD)
+            for i, line in enumerate(self.lines[self.top:self.top + n_visible]):
+                win.addstr(i + 1, 2, line[:win_width - 4])
+            if len(self.lines) > n_visible:
+                position = f" {self.top + 1}-{min(self.top + n_visible, len(self.lines))}/{len(self.lines)} "
+                win.addstr(win_height - 1, max(2, win_width - len(position) - 2), position)
+            win.refresh()
 
-        """Draw visible portion of log to screen"""
-        if height is None or width is None:
-            h, w = self.stdscr.getmaxyx()
-            height = h - start_y
-            width = w - start_x
-        
-        self.stdscr.clear()
+            key = win.getch()
+            if key == curses.KEY_UP:
+                self.top = max(0, self.top - 1)
+            elif key == curses.KEY_DOWN:
+                self.top = min(last_top, self.top + 1)
+            elif key == curses.KEY_PPAGE:
+                self.top = max(0, self.top - n_visible)
+            elif key == curses.KEY_NPAGE:
+                self.top = min(last_top, self.top + n_visible)
+            elif key == curses.KEY_HOME:
+                self.top = 0
+            elif key == curses.KEY_END:
+                self.top = last_top
+            elif key in (ord("\n"), 27):  # ENTER or ESC to exit
+                break
 
-        # Only display last visible lines
-        visible_lines = self.buffer[-height:]
+        del win  # Cleanup window
 
-        for i, line in enumerate(visible_lines):
-            try:
-                self.stdscr.addstr(start_y + i, start_x, line[:width])
-            except curses.error:
-                pass  # Prevent crash on edge cases
-        
-        self.stdscr.refresh()
\ No newline at end of file
+class ScrollingLog:
+    """
+    Log screen with one status line per key (e.g. per component) above the scrolling log.
+    add() and set_status() may be called from worker threads, draw() and handle_key() must be
+    called from the thread that owns the screen.
+
+    The last max_lines lines are kept in a ring. While the end of the log is shown, new lines
+    scroll the log window and only the new lines are drawn, bursts of lines are coalesced into
+    at most FPS frames per second. UP/DOWN, PGUP/PGDN and HOME/END scroll back through the ring.
+    """
+    FPS = 30
+
+    def __init__(self, stdscr, max_lines=1000):
+        self.buffer = deque(maxlen=max_lines)
+        # Lines added so far, the newest line in the ring has the index added - 1
+        self.added = 0
+        self.status_lines = {}
+        self.max_lines = max_lines
+        self.stdscr = stdscr
+        self.screen = Screen(stdscr)
+        self.lock = threading.Lock()
+        # Lines were added since the last draw, the UI has been woken up for them
+        self.dirty = False
+        self.last_draw = 0.0
+        # First line shown while scrolled back, None while following the end of the log
+        self.top = None
+        self.page = 1
+        # Log window, its geometry and the lines [shown_top, shown_end) on it
+        self.win = None
+        self.geometry = None
+        self.shown_top = self.shown_end = 0
+
+    def add(self, line: str):
+        """Add a new line to the log"""
+        with self.lock:
+            self.buffer.append(line)
+            self.added += 1
+            if self.dirty:
+                return
+            self.dirty = True
+        WAKEUP.notify()
+
+    def set_status(self, key, line):
+        """
+        Set the status line of e.g. one component. line may be a function returning the line,
+        which is called on every draw (e.g. for live progress).
+        """
+        with self.lock:
+            self.status_lines[key] = line
+        WAKEUP.notify()
+
+    def handle_key(self, key: int) -> bool:
+        """Scroll back through the log. Returns whether the key was a scroll key"""
+        with self.lock:
+            added, first = self.added, self.added - len(self.buffer)
+        end_top = max(first, added - self.page)
+        top = end_top if self.top is None else self.top
+        if key == curses.KEY_UP:
+            top -= 1
+        elif key == curses.KEY_DOWN:
+            top += 1
+        elif key == curses.KEY_PPAGE:
+            top -= self.page
+        elif key == curses.KEY_NPAGE:
+            top += self.page
+        elif key == curses.KEY_HOME:
+            top = first
+        elif key == curses.KEY_END:
+            top = end_top
+        else:
+            return False
+        # Scrolling down to the end follows new lines again
+        self.top = None if top >= end_top else max(top, first)
+        return True
+
+    def _log_window(self, geometry: tuple) -> None:
+        _, top, left, height, width = geometry
+        self.win = curses.newwin(height, width, top, left)
+        self.win.scrollok(True)
+        self.win.idlok(True)  # Let curses scroll the terminal instead of rewriting every row
+        self.win.leaveok(True)
+        self.geometry = geometry
+
+    def draw(self, start_y=1, start_x=1, height=None, width=None):
+        """Draw status lines and the lines of the log that are not on the screen yet"""
+        # Coalesce bursts of lines into one frame
+        delay = self.last_draw + 1 / self.FPS - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.last_draw = time.monotonic()
+
+        size = self.stdscr.getmaxyx()
+        if height is None or width is None:
+            height = size[0] - start_y
+            width = size[1] - start_x
+
+        with self.lock:
+            self.dirty = False
+            status_lines = [line() if callable(line) else line for line in self.status_lines.values()]
+            n_status = len(status_lines) + 1 if status_lines else 0
+            log_height = height - n_status
+            added, first = self.added, self.added - len(self.buffer)
+            self.page = max(1, log_height)
+            if self.top is not None and self.top >= added - log_height:
+                self.top = None
+            top = max(first, added - log_height if self.top is None else self.top)
+            end = min(added, top + log_height)
+
+            geometry = (size, start_y + n_status, start_x, log_height, width)
+            # The screen is redrawn after a resize or a popup, the log window with it
+            full = geometry != self.geometry or self.screen.size != size or abs(top - self.shown_top) >= log_height
+            # Lines that are still on the log window after scrolling it
+            kept = range(0) if full else range(max(top, self.shown_top), min(end, self.shown_end))
+            lines = [(index - top, self.buffer[index - first]) for index in range(top, end) if index not in kept]
+
+        if status_lines:
+            if self.top is None:
+                status_lines.append("-" * (width - 1))
+            else:
+                status_lines.append(f"--- Lines {top + 1}-{end} of {added}, END to follow ".ljust(width - 1, "-"))
+        for i, line in enumerate(status_lines):
+            self.screen.put(start_y + i, start_x, line[:width])
+        self.screen.render(update=False)
+
+        if log_height > 0:
+            if full:
+                if geometry != self.geometry:
+                    self._log_window(geometry)
+                self.win.erase()
+            elif top != self.shown_top:
+                self.win.scroll(top - self.shown_top)
+            for row, line in lines:
+                try:
+                    self.win.move(row, 0)
+                    self.win.clrtoeol()
+                    self.win.addstr(row, 0, line[:width - 1])
+                except curses.error:
+                    pass  # Prevent crash on edge cases
+            self.win.noutrefresh()
+        self.shown_top, self.shown_end = top, end
+        curses.doupdate()
@@ -1,19 +1,34 @@
 import curses, sys, threading, time
 import ipaddress
 import logging
-from comp_mgr.ui.common_ui import draw_status_popup, PopupInput, PopupMenu
-from comp_mgr.comp import Rorze
+import os
+import textwrap
+from comp_mgr.backup_diff import diff, format_diff, save_diff
+from comp_mgr.metrics import METRICS
+from comp_mgr.restore import RESTORE_FILTERS, backup_warnings, restore
+from comp_mgr.ui.common_ui import draw_status_popup, redraw_timeout, PopupInput, PopupMenu, PopupText, Screen, WAKEUP
+from comp_mgr.session_pool import SESSION_POOL
 from comp_mgr.config import COMPONENT_MENU_OPTIONS
 
 logger = logging.getLogger(__name__)
 
 class ComponentMenu:
-    def __init__(self, comp_info: dict):
+    BATCH_START = "Start batch edit"
+    BATCH_COMMIT = "Commit batch edit (write to flash)"
+    BATCH_DISCARD = "Discard batch edit"
+    # Number of backups offered for a restore
+    MAX_RESTORE_OPTIONS = 15
+
+    def __init__(self, comp_info: dict, simulation: bool = False):
         self.comp_info = comp_info
+        self.simulation = simulation
         self.component = None
         self.status_message = ""
         self.status_until = 0
         self.menu_actions = []
+        # "Back" or "Quit", once the batch edit is closed in the background
+        self.leave = None
+        self.closing = False
 
     def _resolve_action_entry(self, entry: dict) -> dict:
         """
@@ -45,30 +60,29 @@ class ComponentMenu:
     def set_status(self, msg, duration=3):
         self.status_message = msg
         self.status_until = time.time() + duration
+        WAKEUP.notify()
 
     # TODO draw menu options only when component is not busy (should function - test this)
-    def draw(self, stdscr, current_row, labels):
+    def draw(self, screen, current_row, labels):
         c = self.component
-        stdscr.clear()
+        width = screen.getmaxyx()[1]
 
-        stdscr.addstr(1, 0, f"Component: {c.display_name} {c.identifier} v{c.firmware}")
-        stdscr.addstr(2, 0, f"Current IP: {c.ip}")
-        stdscr.addstr(3, 0, f"System: {c.system}")
-        stdscr.addstr(4, 0, f"Status: {c.status}")
+        screen.put(1, 0, f"Component: {c.display_name} {c.identifier} v{c.firmware}")
+        screen.put(2, 0, f"Current IP: {c.ip}")
+        screen.put(3, 0, f"System: {c.system}")
+        # Bulk operations show their live progress, redrawn every Wakeup.TICK while they run
+        status = c.progress.render() if c.progress else c.status
+        screen.put(4, 0, f"Status: {status}"[:width - 1])
 
         if c.busy:
-            stdscr.addstr(1, 50, "=== BUSY ===")
+            screen.put(1, 50, "=== BUSY ===")
 
         for i, label in enumerate(labels):
-            if i == current_row:
-                stdscr.attron(curses.color_pair(1))
-                stdscr.addstr(i + 6, 5, label)
-                stdscr.attroff(curses.color_pair(1))
-            else:
-                stdscr.addstr(i + 6, 5, label)
+            attr = curses.color_pair(1) if i == current_row else 0
+            screen.put(i + 6, 5, label, attr)
 
-        draw_status_popup(stdscr, self.status_message, self.status_until)
-        stdscr.refresh()
+        draw_status_popup(screen, self.status_message, self.status_until)
+        screen.render()
 
     def build_menu(self):
         """Build menu from COMPONENT_MENU_OPTIONS"""
@@ -90,7 +104,43 @@ class ComponentMenu:
             self.set_status("Action not implemented", 3)
             return
 
-        threading.Thread(target=fn, args=(self.component,),daemon=True).start()
+        self.run_in_background(fn)
+
+    def run_in_background(self, fn):
+        """Run fn(component) in a worker thread, the menu is redrawn as soon as it is done"""
+        def _run():
+            try:
+                fn(self.component)
+            except Exception as e:
+                logger.error(f"Action failed: {e}")
+                self.component.status = f"Action failed: {e}"
+            finally:
+                WAKEUP.notify()
+        threading.Thread(target=_run, daemon=True).start()
+
+    def close_batch(self, commit: bool, leave: str) -> None:
+        """Commit or discard the batch edit in the background, the menu is left once that worked"""
+        def _close(component):
+            try:
+                if commit:
+                    component.status = "Committing batch edit..."
+                    component.commit()
+                else:
+                    component.status = "Discarding batch edit..."
+                    component.rollback()
+                self.leave = leave
+            finally:
+                self.closing = False
+        self.closing = True
+        self.run_in_background(_close)
+
+    def confirm_quit(self, stdscr) -> None:
+        """Uncommitted batch edits are committed or discarded before quitting, ESC stays in the menu"""
+        options = {label: {"label": label, "type": "selection", "key": label}
+                   for label in ("Commit and quit", "Discard and quit")}
+        selection = PopupMenu(stdscr, "Batch edit not committed", options).run()
+        if selection:
+            self.close_batch(selection == "Commit and quit", "Quit")
 
     def run_action_factory(self, stdscr, action):
         if self.component.busy:
@@ -209,6 +259,99 @@ class ComponentMenu:
             component.set_alignment_speed(speed=setting)
         return _action
     
+    def choose_backup(self, stdscr, component, title: str, legacy: bool = False) -> str | None:
+        """Let the user pick one of the newest backups of this component type"""
+        store = component.backup_store()
+        backups = store.names(component.identifier[:5], self.MAX_RESTORE_OPTIONS)
+        if legacy:
+            # .dat files written before the backup store, the .dat of a stored backup is offered by its name
+            backup_dir = component.get_backup_dir()
+            files = [path for path in backup_dir.glob(f"{component.identifier[:5]}_*.dat") if not store.has_backup(path.stem)]
+            files.sort(key=os.path.getmtime, reverse=True)
+            backups += [str(path) for path in files]
+        if not backups:
+            self.set_status("No backups found", 3)
+            return None
+        # PopupMenu returns the label of the selection
+        labels = {os.path.basename(backup): backup for backup in backups[:self.MAX_RESTORE_OPTIONS]}
+        options = {label: {"label": label, "type": "selection", "key": label} for label in labels}
+        return labels.get(PopupMenu(stdscr, title, options).run())
+
+    def restore_popup(self, stdscr):
+        def _action(component):
+            backup = self.choose_backup(stdscr, component, "Restore from backup", legacy=True)
+            if not backup:
+                return
+
+            name = os.path.basename(backup)
+            options = {label: {"label": label, "type": "selection", "key": label} for label in RESTORE_FILTERS}
+            selection = PopupMenu(stdscr, f"Restore from {name}", options).run()
+            if not selection:
+                return
+
+            # A backup of another unit or firmware is only restored after a second look
+            try:
+                warnings = backup_warnings(component, backup)
+            except Exception as e:
+                logger.error(f"Restore failed: {e}")
+                component.status = f"Restore failed: {e}"
+                return
+            if warnings:
+                width = max(20, stdscr.getmaxyx()[1] - 12)
+                lines = [line for warning in warnings for line in textwrap.wrap(warning, width) + [""]]
+                PopupText(stdscr, f"Check before restoring {name}", lines).run()
+            options = {label: {"label": label, "type": "selection", "key": label} for label in ("Restore", "Cancel")}
+            if PopupMenu(stdscr, f"Restore {selection} from {name}?", options).run() != "Restore":
+                return
+
+            def _restore():
+                try:
+                    restore(component, backup, blocks=RESTORE_FILTERS[selection])
+                except Exception as e:
+                    logger.error(f"Restore failed: {e}")
+                    component.status = f"Restore failed: {e}"
+            threading.Thread(target=_restore, daemon=True).start()
+        return _action
+
+    def export_popup(self, stdscr):
+        def _action(component):
+            name = self.choose_backup(stdscr, component, "Export backup (.dat)")
+            if not name:
+                return
+            try:
+                filename = component.backup_store().export(name, component.get_backup_dir())
+                component.status = f"Backup exported to '{filename}'"
+            except Exception as e:
+                logger.error(f"Export failed: {e}")
+                component.status = f"Export failed: {e}"
+        return _action
+
+    def compare_popup(self, stdscr):
+        def _action(component):
+            new = self.choose_backup(stdscr, component, "Compare backup")
+            if not new:
+                return
+            old = self.choose_backup(stdscr, component, f"Compare {new} with")
+            if not old:
+                return
+            store = component.backup_store()
+            try:
+                result = diff(store, old, new)
+                save_diff(result, component.get_backup_dir() / f"diff_{old}_{new}.json")
+            except Exception as e:
+                logger.error(f"Compare failed: {e}")
+                component.status = f"Compare failed: {e}"
+                return
+            PopupText(stdscr, "Backup diff", format_diff(result)).run()
+        return _action
+
+    def metrics_popup(self, stdscr):
+        def _action(component):
+            json_path, prometheus_path = METRICS.save()
+            lines = component.metrics.summary_lines() + ["", f"All components saved to {json_path} and {prometheus_path}"]
+            PopupText(stdscr, "Communication metrics", lines).run()
+        return _action
+
     def set_flip_near_popup(self, stdscr):
         def _action(component):
             options = {
@@ -220,29 +363,47 @@ class ComponentMenu:
             component.set_flip_near(setting=setting)
         return _action
     
+    def default_items(self) -> list[str]:
+        """Batch edits collect the changes of several actions into a single flash write"""
+        if self.component.transaction_depth:
+            batch_items = [self.BATCH_COMMIT, self.BATCH_DISCARD]
+        else:
+            batch_items = [self.BATCH_START]
+        return batch_items + ["Back", "Quit"]
+
     def run(self, stdscr):
         name = self.comp_info["Name"]
         if any(p in name for p in ["TRB", "ALN", "STG", "TBL"]):
-            self.component = Rorze(self.comp_info, self.simulation)
+            self.component = SESSION_POOL.get_session(self.comp_info, self.simulation)
         else:
             raise Exception("Unsupported component type")
+        if self.component is None:
+            return
 
         self.build_menu()
 
-        default_items = ["Back", "Quit"]
-        labels = [a["label"] for a in self.menu_actions] + default_items
-
         curses.curs_set(0)
         stdscr.keypad(True)
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
-        stdscr.timeout(500)
+        screen = Screen(stdscr)
+        # Status changes of the component wake the menu up
+        self.component.on_change = WAKEUP.notify
 
         current_row = 0
 
         while True:
-            self.draw(stdscr, current_row, labels)
-            key = stdscr.getch()
+            if self.leave == "Back":
+                break
+            elif self.leave == "Quit":
+                sys.exit(0)
+            labels = [a["label"] for a in self.menu_actions] + self.default_items()
+            current_row = min(current_row, len(labels) - 1)
+            self.draw(screen, current_row, labels)
+            timeout = redraw_timeout(self.status_until)
+            if self.component.busy or self.component.progress:
+                timeout = min(timeout or WAKEUP.TICK, WAKEUP.TICK)
+            key = WAKEUP.wait(stdscr, timeout)
 
             if key == -1:
                 continue
@@ -256,14 +417,30 @@ class ComponentMenu:
             elif key == ord("\n"):
                 selected = labels[current_row]
 
-                if selected == "Back":
-                    self.component.close_connection()
-                    break
+                if self.closing:
+                    self.set_status("Please wait, until the batch edit is closed", 3)
+                elif selected == "Back":
+                    # Pending batch edits are committed, the session stays in the pool for the next time
+                    if not self.component.transaction_depth:
+                        break
+                    self.close_batch(True, "Back")
+                elif selected == self.BATCH_START:
+                    self.component.begin_transaction()
+                    self.set_status("Batch edit started, changes are written to flash on commit", 3)
+                elif selected == self.BATCH_COMMIT:
+                    self.run_in_background(lambda component: component.commit())
+                elif selected == self.BATCH_DISCARD:
+                    self.run_in_background(lambda component: component.rollback())
                 elif selected == "Quit":
-                    sys.exit(0)
+                    if not self.component.transaction_depth:
+                        sys.exit(0)
+                    self.confirm_quit(stdscr)
+                    screen.invalidate()
                 elif 'action_factory' in self.menu_actions[current_row]:
                     action_entry = self.menu_actions[current_row]
                     self.run_action_factory(stdscr, action_entry)
+                    # The popup drew over the menu
+                    screen.invalidate()
                 else:
                     action = self.menu_actions[current_row]
                     self.run_action(action)
\ No newline at end of file
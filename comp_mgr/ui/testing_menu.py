@@ -1,5 +1,6 @@
 
 import curses, sys
+from comp_mgr.ui.common_ui import Screen, WAKEUP
 from testing.methods import tests
 
 # from comp_mgr.cli.component_menu import ComponentMenu
@@ -10,24 +11,20 @@ class TestingMenu:
     def __init__(self):
         self.tests = tests(None)
 
-    def draw(self, stdscr, current_row):
-        stdscr.clear()
-        stdscr.addstr(0,0,"Testing area, proceed with caution!")
+    def draw(self, screen, current_row):
+        screen.put(0,0,"Testing area, proceed with caution!")
         for i, row in enumerate(self.tests.button_list):
-            if i == current_row:
-                stdscr.attron(curses.color_pair(1))
-                stdscr.addstr(i + 2, 4, row)
-                stdscr.attroff(curses.color_pair(1))
-            else:
-                stdscr.addstr(i + 2, 4, row)
-        stdscr.refresh()
+            attr = curses.color_pair(1) if i == current_row else 0
+            screen.put(i + 2, 4, row, attr)
+        screen.render()
 
     def run(self, stdscr):
         button_list = self.tests.button_list
         current_row = 0
+        screen = Screen(stdscr)
         while True:
-            self.draw(stdscr, current_row)
-            key = stdscr.getch()
+            self.draw(screen, current_row)
+            key = WAKEUP.wait(stdscr)
             if key == curses.KEY_UP:
                 current_row = (current_row - 1) % len(button_list)
             elif key == curses.KEY_DOWN:
@@ -46,4 +43,5 @@ class TestingMenu:
                     stdscr.addstr(height-1,textpos,response)
                     stdscr.refresh()
                     stdscr.getch()
-                    stdscr.attroff(curses.A_BLINK)
\ No newline at end of file
+                    stdscr.attroff(curses.A_BLINK)
+                    screen.invalidate()
\ No newline at end of file
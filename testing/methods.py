@@ -1,8 +1,6 @@
 import logging
-import concurrent.futures
 import os
 import socket
-import subprocess
 from datetime import datetime
 from comp_mgr.comp_if import CompIF
 from comp_mgr.config import NETWORK
@@ -128,30 +126,10 @@ class tests:
         logger.info(f"ip info: {ip_info}")
         return ip_info
 
-    def ping(self, ip):
-        command = ["ping", "-n", "1", "-w", "1000", ip] # 1000ms timeout
-        result = subprocess.run(command, stdout=subprocess.DEVNULL)
-        return ip if result.returncode == 0 else None
-
     def scan_subnet(self):
-        subnet_1 = "192.168.0"
-        subnet_2 = "192.168.30"
-        subnet_3 = "192.168.10"
-
-        ips_1 = [f"{subnet_1}.{octet}" for octet in range(255)]
-        ips_2 = [f"{subnet_2}.{octet}" for octet in range(255)]
-        ips_3 = [f"{subnet_3}.{octet}" for octet in range(255)]
-
-        ips = ips_1 + ips_2 + ips_3
-        alive = []
-        n_workers = len(ips)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
-            results = executor.map(self.ping, ips)
-            for result in results:
-                if result:
-                    alive.append(result)
-        
+        subnets = ["192.168.0.0/24", "192.168.30.0/24", "192.168.10.0/24"]
+
         logger.debug("Scanning subnets...")
+        alive = list(CompIF().sweep(subnets))
         logger.debug(str(alive))
-        return str(alive)
\ No newline at end of file
+        return str(alive)